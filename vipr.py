@@ -1,7 +1,105 @@
-import pygame
+import time
+_process_start = time.perf_counter()
+
 import sys
+import os
+import importlib
+import json
+import queue
+import threading
+import weakref
+import array
+import hashlib
+import signal
+import collections
+import concurrent.futures
+import contextlib
 import math
+import gc
+import pickle
+import operator
 import random
+import asyncio
+import shlex
+import heapq
+import itertools
+
+# --- Lazy pygame ---
+# pygame is only imported when something actually touches it (main(), drawing,
+# events), so headless and library use of the node classes never pays for it.
+os.environ.setdefault( "PYGAME_HIDE_SUPPORT_PROMPT", "1" )
+
+class _LazyPygame:
+    def __getattr__( self, attr ):
+        return getattr( _load_pygame(), attr )
+
+def _load_pygame():
+    global pygame
+    if isinstance( pygame, _LazyPygame ):
+        pygame = importlib.import_module( "pygame" ) # Rebind so later accesses are direct
+    return pygame
+
+pygame = _LazyPygame()
+
+class HeadlessRect:
+    # --- Minimal stand-in for pygame.Rect used while pygame is not loaded ---
+    __slots__ = ( 'x', 'y', 'width', 'height' )
+
+    def __init__( self, x, y, width, height ):
+        self.x = int( x )
+        self.y = int( y )
+        self.width = int( width )
+        self.height = int( height )
+
+    left = property( lambda self: self.x, lambda self, value: setattr( self, 'x', int( value ) ) )
+    top = property( lambda self: self.y, lambda self, value: setattr( self, 'y', int( value ) ) )
+    right = property( lambda self: self.x + self.width )
+    bottom = property( lambda self: self.y + self.height )
+    centerx = property( lambda self: self.x + self.width // 2 )
+    centery = property( lambda self: self.y + self.height // 2 )
+    center = property( lambda self: ( self.centerx, self.centery ) )
+    size = property( lambda self: ( self.width, self.height ) )
+
+    @property
+    def topleft( self ):
+        return ( self.x, self.y )
+
+    @topleft.setter
+    def topleft( self, pos ):
+        self.x, self.y = int( pos[ 0 ] ), int( pos[ 1 ] )
+
+    def collidepoint( self, *pos ):
+        px, py = pos[ 0 ] if len( pos ) == 1 else pos
+        return self.x <= px < self.x + self.width and self.y <= py < self.y + self.height
+
+    def __iter__( self ):
+        return iter( ( self.x, self.y, self.width, self.height ) )
+
+    def __len__( self ):
+        return 4
+
+    def __getitem__( self, index ):
+        return ( self.x, self.y, self.width, self.height )[ index ]
+
+    def __repr__( self ):
+        return "<HeadlessRect(%d, %d, %d, %d)>" % tuple( self )
+
+def make_rect( x, y, width, height ):
+    if isinstance( pygame, _LazyPygame ):
+        return HeadlessRect( x, y, width, height )
+    return pygame.Rect( x, y, width, height )
+
+# --- Fonts ---
+# pygame.font.SysFont scans every installed font on first use, which dominated
+# cold start. The bundled default font (or VIPR_FONT) is loaded directly instead.
+FONT_PATH = os.environ.get( "VIPR_FONT" ) or None
+_fonts = {}
+
+def load_font( size ):
+    if size not in _fonts:
+        path = FONT_PATH if FONT_PATH and os.path.isfile( FONT_PATH ) else None
+        _fonts[ size ] = pygame.font.Font( path, size )
+    return _fonts[ size ]
 
 # --- Colors ---
 WHITE = ( 255, 255, 255 )
@@ -12,13 +110,17 @@ NODE_BORDER_COLOR = ( 200, 200, 220 )
 CONNECTION_COLOR = ( 200, 200, 100 )
 SOCKET_COLOR = ( 50, 150, 250 )
 INPUT_BOX_COLOR = ( 30, 30, 40 )
+SELECTION_COLOR = ( 250, 200, 50 )
+GROUP_BODY_COLOR = ( 80, 100, 90 )
+TYPE_ERROR_COLOR = ( 230, 80, 80 )
 
 class ContextMenu:
     # --- Right-click context menu ---
-    def __init__( self, pos, options, all_nodes ):
+    def __init__( self, pos, options, graph, canvas_pos=None ):
         self.pos = pos
+        self.canvas_pos = canvas_pos or pos # Where new nodes go, in canvas coordinates
         self.options = options
-        self.all_nodes = all_nodes
+        self.graph = graph
         self.rects = []
         self.width = 150
         self.height = len( options ) * 25
@@ -37,8 +139,8 @@ class ContextMenu:
                     if item[ 'rect' ].collidepoint( event.pos ):
                         action = self.options[ item[ 'text' ] ]
                         if callable( action ):
-                            new_node = action( self.pos )
-                            self.all_nodes.append( new_node )
+                            new_node = action( self.canvas_pos )
+                            self.graph.add_node( new_node )
                         return True # Menu was used
             # Any click outside the menu closes it
             if not self.menu_rect.collidepoint( event.pos ):
@@ -50,16 +152,321 @@ class ContextMenu:
         pygame.draw.rect( surface, ( 150, 150, 150 ), self.menu_rect, 1 )
         for item in self.rects:
             # Highlight on hover
-            if item[ 'rect' ].collidepoint( pygame.mouse.get_pos() ):
+            if item[ 'rect' ].collidepoint( input_mouse_pos() ):
                 pygame.draw.rect( surface, ( 80, 80, 100 ), item[ 'rect' ] )
 
             text_surf = font.render( item[ 'text' ], True, WHITE )
             surface.blit( text_surf, ( item[ 'rect' ].x + 5, item[ 'rect' ].y + 5 ) )
 
+# --- Value Previews ---
+# Values can be huge (big integers from Exponent, long strings from Concatenate),
+# so previews are built from a bounded part of the value and cached per node.
+PREVIEW_CHARS = 24 # Longest preview text drawn on a node
+PREVIEW_ITEMS = 3 # Items shown from each end of a sequence
+LOG10_2 = math.log10( 2 )
+
+def _format_int( value, limit ):
+    if value.bit_length() <= limit * 10 // 3 + 1: # At most about limit digits (log2( 10 ) < 10 / 3), cheap to convert
+        text = str( value )
+        if len( text ) <= limit:
+            return text
+    # Leading digits from the top 53 bits, trailing digits from a small modulus
+    magnitude = abs( value )
+    shift = max( 0, magnitude.bit_length() - 53 )
+    exponent10 = math.log10( magnitude >> shift ) + shift * LOG10_2
+    exponent = int( exponent10 )
+    nearest = round( exponent10 )
+    if abs( exponent10 - nearest ) < 1e-6: # Too close to a power of ten for the estimate to tell the digit count
+        exponent = nearest if magnitude >= 10 ** nearest else nearest - 1
+    mantissa = 10 ** ( exponent10 - exponent )
+    digits = exponent + 1
+    if mantissa >= 9.99995: # Shown rounded up to the next power of ten
+        mantissa /= 10
+        exponent += 1
+    sign = "-" if value < 0 else ""
+    return "%s%.4fe+%d (%d digits)" % ( sign, mantissa, exponent, digits )
+
+def _truncate( text, limit ):
+    if len( text ) <= limit:
+        return text
+    keep = max( 1, ( limit - 3 ) // 2 )
+    return "%s...%s (%d)" % ( text[ :keep ], text[ -keep: ], len( text ) )
+
+def _format_item( item ):
+    if isinstance( item, float ):
+        return "%g" % item
+    if isinstance( item, int ):
+        return _format_int( item, 8 )
+    return _truncate( str( item ), 8 )
+
+def format_value( value, limit=PREVIEW_CHARS ):
+    # Short display text for a value, without ever converting all of it to text
+    if isinstance( value, bool ) or value is None:
+        return str( value )
+    if isinstance( value, int ):
+        return _format_int( value, limit )
+    if isinstance( value, float ):
+        if abs( value ) < 1e12:
+            return "%.2f" % value # Format floats nicely
+        return "%.4g" % value
+    if isinstance( value, str ):
+        return _truncate( value, limit )
+    if hasattr( value, "shape" ) and hasattr( value, "dtype" ): # NumPy arrays
+        shape = "x".join( str( size ) for size in value.shape )
+        if value.ndim != 1:
+            return "%s array [%s]" % ( value.dtype, shape )
+        head = ", ".join( _format_item( item ) for item in value[ :PREVIEW_ITEMS ].tolist() )
+        if len( value ) > PREVIEW_ITEMS * 2:
+            tail = ", ".join( _format_item( item ) for item in value[ -PREVIEW_ITEMS: ].tolist() )
+            return "%s[%s]: %s ... %s" % ( value.dtype, shape, head, tail )
+        return "%s[%s]: %s" % ( value.dtype, shape, head )
+    if isinstance( value, ( list, tuple ) ) or hasattr( value, "typecode" ): # Lists and array.array
+        if len( value ) > PREVIEW_ITEMS * 2:
+            head = ", ".join( _format_item( item ) for item in value[ :PREVIEW_ITEMS ] )
+            tail = ", ".join( _format_item( item ) for item in value[ -PREVIEW_ITEMS: ] )
+            return "[%d]: %s ... %s" % ( len( value ), head, tail )
+        return "[%s]" % ", ".join( _format_item( item ) for item in value )
+    return _truncate( str( value ), limit )
+
+# --- Typed Arrays ---
+# ArrayNode values are contiguous typed buffers (int64 or float64) parsed in one
+# bulk step. With NumPy installed they are exposed as zero-copy NumPy views;
+# NumPy is optional and imported lazily. Arithmetic and logic nodes work
+# element-wise on arrays either way (see _elementwise): NumPy does the work when
+# it can, other values go item by item, and arrays of different lengths give
+# "Error" instead of broadcasting or concatenating.
+_numpy_module = None
+
+def _numpy():
+    global _numpy_module
+    if _numpy_module is None:
+        try:
+            _numpy_module = importlib.import_module( "numpy" )
+        except ImportError:
+            _numpy_module = False
+    return _numpy_module or None
+
+def _wrap_buffer( buffer ):
+    numpy = _numpy()
+    if numpy is None:
+        return buffer
+    return numpy.frombuffer( buffer, dtype=numpy.int64 if buffer.typecode == 'q' else numpy.float64 )
+
+def _is_array( value ):
+    return hasattr( value, "dtype" ) and hasattr( value, "shape" ) # NumPy arrays (array values, Monte Carlo samples)
+
+def _divide( val_a, val_b, operation ):
+    # "Error" for a zero divisor; arrays are divided element-wise instead, with
+    # NaN wherever the divisor is zero
+    if _is_array( val_a ) or _is_array( val_b ):
+        numpy = _numpy()
+        zero = numpy.asarray( val_b ) == 0
+        if not zero.any():
+            return operation( val_a, val_b )
+        with numpy.errstate( divide="ignore", invalid="ignore" ):
+            result = operation( numpy.asarray( val_a, dtype=numpy.float64 ), numpy.where( zero, 1, val_b ) )
+        return numpy.where( zero, numpy.nan, result )
+    if val_b != 0:
+        return operation( val_a, val_b )
+    return "Error"
+
+def parse_array( text ):
+    # Comma separated text -> int64 buffer, else float64 buffer, else a list
+    # (huge integers or text items, which fit no machine type)
+    text = text.strip()
+    if text.startswith( "[" ) and text.endswith( "]" ):
+        text = text[ 1:-1 ]
+    parts = text.split( "," ) if text.strip() else []
+    try:
+        return _wrap_buffer( array.array( 'q', map( int, parts ) ) )
+    except OverflowError:
+        return [ int( part ) for part in parts ]
+    except ValueError:
+        pass
+    try:
+        return _wrap_buffer( array.array( 'd', map( float, parts ) ) )
+    except ValueError:
+        return [ part.strip() for part in parts ]
+
+def array_from_list( values ):
+    # Same buffer types for values that are already parsed (defaults, saved graphs)
+    if hasattr( values, "dtype" ) or hasattr( values, "typecode" ):
+        return values
+    numpy = _numpy()
+    if numpy is not None and values and isinstance( values[ 0 ], bool ) and all( isinstance( value, bool ) for value in values ):
+        return numpy.array( values, dtype=bool ) # Element-wise Not and comparisons
+    try:
+        return _wrap_buffer( array.array( 'q', values ) )
+    except OverflowError:
+        return list( values ) # Huge integers stay exact
+    except TypeError:
+        pass
+    try:
+        return _wrap_buffer( array.array( 'd', values ) )
+    except ( TypeError, OverflowError ):
+        return list( values )
+
+def _is_sequence( value ):
+    return _is_array( value ) or hasattr( value, "typecode" ) or isinstance( value, list )
+
+def _elementwise( numpy_kernel, item_kernel ):
+    # A kernel for two inputs that may each be an array or a scalar
+    def kernel( val_a, val_b ):
+        sequence_a = _is_sequence( val_a )
+        sequence_b = _is_sequence( val_b )
+        if not ( sequence_a or sequence_b ):
+            return item_kernel( val_a, val_b )
+        if sequence_a and sequence_b and len( val_a ) != len( val_b ):
+            return "Error"
+        if ( _is_array( val_a ) or not sequence_a ) and ( _is_array( val_b ) or not sequence_b ):
+            return numpy_kernel( val_a, val_b )
+        # array.array buffers (no NumPy) and lists of huge integers or text
+        items_a = ( val_a.tolist() if _is_array( val_a ) else val_a ) if sequence_a else itertools.repeat( val_a )
+        items_b = ( val_b.tolist() if _is_array( val_b ) else val_b ) if sequence_b else itertools.repeat( val_b )
+        return array_from_list( [ item_kernel( a, b ) for a, b in zip( items_a, items_b ) ] )
+    return kernel
+
+def _elementwise_unary( numpy_kernel, item_kernel ):
+    def kernel( val_a ):
+        if _is_array( val_a ):
+            return numpy_kernel( val_a )
+        if _is_sequence( val_a ):
+            return array_from_list( [ item_kernel( a ) for a in val_a ] )
+        return item_kernel( val_a )
+    return kernel
+
+def _numeric( operation ):
+    # NumPy treats bool arrays as logic (True + True is True, and it refuses to
+    # subtract them); count them as 0 and 1, like Python does for items
+    def kernel( *values ):
+        return operation( *[ value.astype( _numpy().int64 ) if _is_array( value ) and value.dtype.kind == 'b' else value for value in values ] )
+    return kernel
+
+def _nan_on_zero( operation ):
+    # Item by item counterpart of _divide's array branch
+    return lambda val_a, val_b: operation( val_a, val_b ) if val_b != 0 else math.nan
+
+def array_text( value ):
+    # Editable text for an array value
+    if hasattr( value, "tolist" ):
+        value = value.tolist()
+    return ",".join( str( item ) for item in value )
+
+def paste_text():
+    try:
+        pygame.scrap.init()
+        return pygame.scrap.get_text() or ""
+    except ( pygame.error, AttributeError ):
+        return ""
+
+# --- Types ---
+# Socket types are inferred statically, from the constants of the input nodes
+# downstream through the DAG (Graph.infer_types). Operator nodes use them to
+# pick typed defaults for unconnected inputs and a kernel specialised for their
+# input types, and the editor refuses connections that would not type-check.
+ANY = 'any' # Not known statically (group inputs, mixed results)
+NUMBER_TYPES = ( 'bool', 'int', 'float', 'number' ) # 'number' is an int or a float
+ARRAY_TYPES = ( 'bool array', 'int array', 'float array', 'number array', 'str array' ) # By element type
+_DTYPE_KINDS = { 'b': 'bool', 'i': 'int', 'u': 'int', 'f': 'float', 'U': 'str' }
+
+def _array_type( element_type ):
+    return element_type + ' array'
+
+def _element_type( of_type ):
+    # Element type of an array type; scalars are their own element type
+    return of_type[ :-len( ' array' ) ] if of_type in ARRAY_TYPES else of_type
+
+def value_type( value ):
+    if isinstance( value, bool ):
+        return 'bool'
+    if isinstance( value, int ):
+        return 'int'
+    if isinstance( value, float ):
+        return 'float'
+    if isinstance( value, str ):
+        return 'str'
+    if _is_array( value ):
+        return _array_type( _DTYPE_KINDS[ value.dtype.kind ] ) if value.dtype.kind in _DTYPE_KINDS else ANY
+    if hasattr( value, "typecode" ): # array.array buffers, without NumPy
+        return 'float array' if value.typecode == 'd' else 'int array'
+    if isinstance( value, list ): # Huge integers or text items
+        if all( isinstance( item, int ) for item in value ):
+            return 'int array'
+        if all( isinstance( item, str ) for item in value ):
+            return 'str array'
+        if all( isinstance( item, ( int, float ) ) for item in value ):
+            return 'float array'
+    return ANY
+
+def _fill_types( types, fallback='int' ):
+    # An unconnected input (None) takes the type of a connected one, so its default matches it
+    known = [ t for t in types if t is not None ]
+    return [ t if t is not None else ( known[ 0 ] if known else fallback ) for t in types ]
+
+def _identity( value, of_type ):
+    # An identity element (0 or 1) in the type of the value it is combined with
+    if of_type == 'float':
+        return float( value )
+    if of_type == 'bool':
+        return bool( value )
+    return value
+
+def _arithmetic_type( name, types ):
+    # Result type of arithmetic on numbers and number arrays
+    if ANY in types:
+        return ANY
+    elements = [ _element_type( t ) for t in types ]
+    if all( t in NUMBER_TYPES for t in elements ):
+        if 'float' in elements:
+            result = 'float'
+        else:
+            result = 'number' if 'number' in elements else 'int'
+        return _array_type( result ) if any( t in ARRAY_TYPES for t in types ) else result
+    raise TypeError( "%s cannot take %s" % ( name, " and ".join( types ) ) )
+
+def _pick_kernel( types, scalar_kernel, array_kernel ):
+    # Plain values skip the array checks
+    if any( t in ARRAY_TYPES or t == ANY for t in types ):
+        return array_kernel
+    return scalar_kernel
+
+def _item_power( val_a, val_b ):
+    # Matches the array branch of _power: inf for 0 ** -n or an overflow, NaN
+    # where Python would give a complex number
+    try:
+        result = val_a ** val_b
+    except ( ZeroDivisionError, OverflowError ):
+        return math.inf
+    return math.nan if isinstance( result, complex ) else result
+
+def _scalar_truediv( val_a, val_b ):
+    return val_a / val_b if val_b != 0 else "Error"
+
+def _scalar_mod( val_a, val_b ):
+    return val_a % val_b if val_b != 0 else "Error"
+
+def _scalar_floordiv( val_a, val_b ):
+    return val_a // val_b if val_b != 0 else "Error"
+
+def _divided_array_type( result ):
+    # Integer arrays become floats where a divisor is zero (NaN)
+    return 'number array' if result in ( 'bool array', 'int array' ) else result
+
+def _divide_kernel( types, operation, scalar_kernel ):
+    # Two plain numbers skip _divide's array checks
+    if all( t in NUMBER_TYPES for t in types ):
+        return scalar_kernel
+    return _elementwise( _numeric( lambda val_a, val_b: _divide( val_a, val_b, operation ) ), _nan_on_zero( operation ) )
+
 # --- Node Base Class ---
 class Node:
+    body_color = NODE_BODY_COLOR
+    next_id = 1 # Ids are stable across save/load, unlike id( self )
+    geometry_epoch = 0 # Bumped whenever any node moves or resizes
+    live = weakref.WeakSet() # Every Node object not yet freed, for the memory report
+
     def __init__( self, x, y, width, height, title="Node" ):
-        self.rect = pygame.Rect( x, y, width, height )
+        self.rect = make_rect( x, y, width, height )
         self.min_width = 80
         self.min_height = 50
         self.title = title
@@ -67,20 +474,31 @@ class Node:
         self.is_resizing = False
         self.drag_offset_x = 0
         self.drag_offset_y = 0
-        self.id = id( self )
+        self.drag_start_rect = None
+        self.selected = False
+        self.types = {} # Output socket name -> inferred type
+        self.type_error = None # Why the inferred input types do not fit, if they do not
+        self.error = None # Why the last compute() raised, if it did
+        self.geometry_version = 0 # Bumped whenever this node moves or resizes
+        self.preview_value = None # Value, font and surface last drawn by draw_value
+        self.preview_font = None
+        self.preview_surf = None
+        self.id = Node.next_id
+        Node.next_id += 1
+        Node.live.add( self )
 
         self.input_sockets = []
         self.output_sockets = []
         self.values = {} # To store computed values for outputs
 
         # --- Handle for resizing ---
-        self.resize_handle_rect = pygame.Rect( self.rect.right - 10, self.rect.bottom - 10, 10, 10)
+        self.resize_handle_rect = make_rect( self.rect.right - 10, self.rect.bottom - 10, 10, 10)
 
     def add_input( self, name ):
         self.input_sockets.append( { 'name': name, 'pos': ( 0,0 ), 'rect': None, 'connection': None } )
 
     def add_output( self, name ):
-        self.output_sockets.append( { 'name': name, 'pos': ( 0,0 ), 'rect': None } )
+        self.output_sockets.append( { 'name': name, 'pos': ( 0,0 ), 'rect': None, 'connections': [] } )
         self.values[ name ] = 0 # Default output value
 
     def _update_socket_positions( self ):
@@ -88,36 +506,54 @@ class Node:
         input_spacing = self.rect.height / ( len( self.input_sockets ) + 1 )
         for i, sock in enumerate( self.input_sockets ):
             sock[ 'pos' ] = ( self.rect.left, self.rect.top + int( input_spacing * ( i + 1 ) ) )
-            sock[ 'rect' ] = pygame.Rect( sock[ 'pos' ][ 0 ] - 5, sock[ 'pos' ][ 1 ] - 5, 10, 10 )
+            sock[ 'rect' ] = make_rect( sock[ 'pos' ][ 0 ] - 5, sock[ 'pos' ][ 1 ] - 5, 10, 10 )
 
         # Output sockets on the right
         output_spacing = self.rect.height / ( len( self.output_sockets ) + 1 )
         for i, sock in enumerate( self.output_sockets ):
             sock[ 'pos' ] = ( self.rect.right, self.rect.top + int( output_spacing * ( i + 1 ) ) )
-            sock[ 'rect' ] = pygame.Rect( sock[ 'pos' ][ 0 ] - 5, sock[ 'pos' ][ 1 ] - 5, 10, 10 )
+            sock[ 'rect' ] = make_rect( sock[ 'pos' ][ 0 ] - 5, sock[ 'pos' ][ 1 ] - 5, 10, 10 )
 
         # Update resize handle position
         self.resize_handle_rect.topleft = ( self.rect.right - 10, self.rect.bottom - 10 )
 
-    def handle_event( self, event, global_state, connections ):
+        # Invalidates cached geometry derived from the sockets (e.g. connection lines)
+        self.geometry_version += 1
+        Node.geometry_epoch += 1
+
+    def _translate( self, dx, dy ):
+        # Move without laying the sockets out again; callers bump Node.geometry_epoch once
+        self.rect.x += dx
+        self.rect.y += dy
+        for sock in self.input_sockets + self.output_sockets:
+            sock[ 'pos' ] = ( sock[ 'pos' ][ 0 ] + dx, sock[ 'pos' ][ 1 ] + dy )
+            sock[ 'rect' ].x += dx
+            sock[ 'rect' ].y += dy
+        self.resize_handle_rect.x += dx
+        self.resize_handle_rect.y += dy
+        self.geometry_version += 1
+
+    def handle_event( self, event, global_state, graph ):
         if event.type == pygame.MOUSEBUTTONDOWN:
             if event.button == 1: # Left-click
                 # Start resizing
                 if self.resize_handle_rect.collidepoint( event.pos ):
                     self.is_resizing = True
+                    self.drag_start_rect = tuple( self.rect )
                     return True
 
-                # Start a connection from an output socket
-                for sock in self.output_sockets:
+                # Start a connection from an output socket (by id, so UI state never keeps a deleted node alive)
+                for index, sock in enumerate( self.output_sockets ):
                     if sock[ 'rect' ].collidepoint( event.pos ):
                         global_state[ 'is_drawing_connection' ] = True
-                        global_state[ 'connection_start_node' ] = self
-                        global_state[ 'connection_start_socket' ] = sock
+                        global_state[ 'connection_start_node' ] = self.id
+                        global_state[ 'connection_start_socket' ] = index
                         return True
 
                 # Start dragging the node
                 if self.rect.collidepoint( event.pos ):
                     self.is_dragging = True
+                    self.drag_start_rect = tuple( self.rect )
                     self.drag_offset_x = self.rect.x - event.pos[ 0 ]
                     self.drag_offset_y = self.rect.y - event.pos[ 1 ]
                     return True
@@ -126,22 +562,20 @@ class Node:
                  # Disconnect an input socket
                  for sock in self.input_sockets:
                     if sock[ 'rect' ].collidepoint( event.pos ) and sock[ 'connection' ] is not None:
-                        # Find and remove the connection from the global list
-                        for conn in connections[:]:
-                            if conn[ 'target_node' ] == self and conn[ 'target_socket' ] == sock:
-                                connections.remove( conn )
-                                break
-                        sock[ 'connection' ] = None # Clear local link
+                        graph.disconnect( sock[ 'connection' ] ) # Also clears the local link
                         return True
 
 
         elif event.type == pygame.MOUSEBUTTONUP:
             if event.button == 1:
+                # A whole drag is recorded as a single move/resize
                 if self.is_dragging:
                     self.is_dragging = False
+                    graph.set_rect( self, tuple( self.rect ), previous=self.drag_start_rect )
                     return True
                 if self.is_resizing:
                     self.is_resizing = False
+                    graph.set_rect( self, tuple( self.rect ), previous=self.drag_start_rect )
                     return True
 
 
@@ -160,27 +594,59 @@ class Node:
                 return True
         return False
 
-    def draw( self, surface, font ):
+    def draw( self, surface, font, offset=( 0, 0 ) ):
+        # Rects are canvas coordinates; offset is where the view puts the canvas origin on screen
+        rect = self.rect.move( offset )
+
         # Draw body
-        pygame.draw.rect( surface, NODE_BODY_COLOR, self.rect, border_radius=5 )
-        pygame.draw.rect( surface, NODE_BORDER_COLOR, self.rect, 2, border_radius=5 )
+        pygame.draw.rect( surface, self.body_color, rect, border_radius=5 )
+        border_color = SELECTION_COLOR if self.selected else TYPE_ERROR_COLOR if self.type_error or self.error else NODE_BORDER_COLOR
+        pygame.draw.rect( surface, border_color, rect, 2, border_radius=5 )
 
         # Draw title
         title_surf = font.render( self.title, True, WHITE )
-        title_rect = title_surf.get_rect( center=( self.rect.centerx, self.rect.top + 15 ) )
+        title_rect = title_surf.get_rect( center=( rect.centerx, rect.top + 15 ) )
         surface.blit( title_surf, title_rect )
 
         # Draw sockets
         for sock in self.input_sockets + self.output_sockets:
-            pygame.draw.rect( surface, SOCKET_COLOR, sock[ 'rect' ], border_radius=2 )
-            pygame.draw.rect( surface, WHITE, sock[ 'rect' ], 1, border_radius=2 )
+            sock_rect = sock[ 'rect' ].move( offset )
+            pygame.draw.rect( surface, SOCKET_COLOR, sock_rect, border_radius=2 )
+            pygame.draw.rect( surface, WHITE, sock_rect, 1, border_radius=2 )
         
         # Draw resize handle
-        pygame.draw.rect(surface, NODE_BORDER_COLOR, self.resize_handle_rect)
+        pygame.draw.rect(surface, NODE_BORDER_COLOR, self.resize_handle_rect.move( offset ))
+
+    def draw_value( self, surface, font, value, offset=( 0, 0 ) ):
+        # Draw a value centered on the node; the text is only re-formatted and
+        # re-rendered when a different value object (or font) is shown
+        if value is not self.preview_value or font is not self.preview_font or self.preview_surf is None:
+            self.preview_value = value
+            self.preview_font = font
+            self.preview_surf = font.render( format_value( value ), True, WHITE )
+        surface.blit( self.preview_surf, self.preview_surf.get_rect( center=self.rect.move( offset ).center ) )
+
+    def infer( self, input_types ):
+        # Output types for the given input types (None when unconnected); TypeError if they do not fit
+        if hasattr( self, "value" ): # Input nodes have the type of their constant
+            return { sock[ 'name' ]: value_type( self.value ) for sock in self.output_sockets }
+        return { sock[ 'name' ]: ANY for sock in self.output_sockets }
+
+    def specialize( self, input_types ):
+        # Prepare compute() for input types that passed infer()
+        pass
 
     def compute( self ):
         pass
 
+    def release( self ):
+        # Drop computed results once removed from the graph; they are recomputed if it is re-added
+        for name in self.values:
+            self.values[ name ] = 0
+        self.preview_value = None
+        self.preview_font = None
+        self.preview_surf = None
+
 # --- Specific Node Implementations ---
 # --- Input nodes ---
 class IntegerNode( Node ):
@@ -193,15 +659,16 @@ class IntegerNode( Node ):
         self.input_text = str( self.value )
         self.last_click_time = 0
 
-    def handle_event( self, event, global_state, connections ):
+    def handle_event( self, event, global_state, graph ):
         # --- Handle keyboard input when in edit mode ---
         if self.editing:
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_RETURN:
                     try:
-                        self.value = int( self.input_text )
+                        value = int( self.input_text )
                     except ValueError:
-                        self.value = 0 # Default to 0 if input is invalid
+                        value = 0 # Default to 0 if input is invalid
+                    graph.set_value( self, value )
                     self.editing = False
                 elif event.key == pygame.K_BACKSPACE:
                     self.input_text = self.input_text[ :-1 ]
@@ -218,8 +685,8 @@ class IntegerNode( Node ):
             if self.rect.collidepoint( event.pos ):
                 # Prevent editing when resizing
                 if self.resize_handle_rect.collidepoint(event.pos):
-                    return super().handle_event(event, global_state, connections)
-                current_time = pygame.time.get_ticks()
+                    return super().handle_event(event, global_state, graph)
+                current_time = input_ticks()
                 # Check for double-click (e.g., within 500 milliseconds)
                 if current_time - self.last_click_time < 500:
                     self.editing = True
@@ -231,18 +698,19 @@ class IntegerNode( Node ):
         # --- Fallback to base class event handling (for dragging, etc.) ---
         # Ensure editing mode doesn't interfere with starting a drag
         if not self.editing:
-            return super().handle_event( event, global_state, connections )
+            return super().handle_event( event, global_state, graph )
         return False
 
     def compute( self ):
         self.values[ "out" ] = self.value
 
-    def draw( self, surface, font ):
-        super().draw( surface, font )
+    def draw( self, surface, font, offset=( 0, 0 ) ):
+        super().draw( surface, font, offset )
         
         if self.editing:
             # --- Draw the input box when editing ---
-            input_rect = pygame.Rect( self.rect.centerx - 40, self.rect.centery - 12, 80, 24 )
+            center = self.rect.move( offset ).center
+            input_rect = pygame.Rect( center[ 0 ] - 40, center[ 1 ] - 12, 80, 24 )
             pygame.draw.rect( surface, INPUT_BOX_COLOR, input_rect )
             pygame.draw.rect( surface, WHITE, input_rect, 1 )
             
@@ -250,13 +718,13 @@ class IntegerNode( Node ):
             surface.blit( text_surf, ( input_rect.x + 5, input_rect.y + 5 ) )
 
             # Blinking cursor
-            if pygame.time.get_ticks() % 1000 < 500:
+            if input_ticks() % 1000 < 500:
                 cursor_pos = input_rect.x + text_surf.get_width() + 8
                 pygame.draw.line( surface, WHITE, ( cursor_pos, input_rect.y + 5 ), ( cursor_pos, input_rect.y + 18 ) )
         else:
             # --- Display the value on the node ---
             value_surf = font.render( str( self.value ), True, WHITE )
-            value_rect = value_surf.get_rect( center=self.rect.center )
+            value_rect = value_surf.get_rect( center=self.rect.move( offset ).center )
             surface.blit( value_surf, value_rect )
 
 class RndIntegerNode( Node ):
@@ -269,12 +737,12 @@ class RndIntegerNode( Node ):
     def compute( self ):
         self.values[ "out" ] = self.value
 
-    def draw( self, surface, font ):
-        super().draw( surface, font )
+    def draw( self, surface, font, offset=( 0, 0 ) ):
+        super().draw( surface, font, offset )
         
         # --- Display the value on the node ---
         value_surf = font.render( str( self.value ), True, WHITE )
-        value_rect = value_surf.get_rect( center=self.rect.center )
+        value_rect = value_surf.get_rect( center=self.rect.move( offset ).center )
         surface.blit( value_surf, value_rect )
 
 class FloatNode( Node ):
@@ -287,15 +755,16 @@ class FloatNode( Node ):
         self.input_text = str( self.value )
         self.last_click_time = 0
 
-    def handle_event( self, event, global_state, connections ):
+    def handle_event( self, event, global_state, graph ):
         # --- Handle keyboard input when in edit mode ---
         if self.editing:
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_RETURN:
                     try:
-                        self.value = float( self.input_text )
+                        value = float( self.input_text )
                     except ValueError:
-                        self.value = 0 # Default to 0 if input is invalid
+                        value = 0 # Default to 0 if input is invalid
+                    graph.set_value( self, value )
                     self.editing = False
                 elif event.key == pygame.K_BACKSPACE:
                     self.input_text = self.input_text[ :-1 ]
@@ -312,8 +781,8 @@ class FloatNode( Node ):
             if self.rect.collidepoint( event.pos ):
                 # Prevent editing when resizing
                 if self.resize_handle_rect.collidepoint(event.pos):
-                    return super().handle_event(event, global_state, connections)
-                current_time = pygame.time.get_ticks()
+                    return super().handle_event(event, global_state, graph)
+                current_time = input_ticks()
                 # Check for double-click (e.g., within 500 milliseconds)
                 if current_time - self.last_click_time < 500:
                     self.editing = True
@@ -325,18 +794,19 @@ class FloatNode( Node ):
         # --- Fallback to base class event handling (for dragging, etc.) ---
         # Ensure editing mode doesn't interfere with starting a drag
         if not self.editing:
-            return super().handle_event( event, global_state, connections )
+            return super().handle_event( event, global_state, graph )
         return False
 
     def compute( self ):
         self.values[ "out" ] = self.value
 
-    def draw( self, surface, font ):
-        super().draw( surface, font )
+    def draw( self, surface, font, offset=( 0, 0 ) ):
+        super().draw( surface, font, offset )
         
         if self.editing:
             # --- Draw the input box when editing ---
-            input_rect = pygame.Rect( self.rect.centerx - 40, self.rect.centery - 12, 80, 24 )
+            center = self.rect.move( offset ).center
+            input_rect = pygame.Rect( center[ 0 ] - 40, center[ 1 ] - 12, 80, 24 )
             pygame.draw.rect( surface, INPUT_BOX_COLOR, input_rect )
             pygame.draw.rect( surface, WHITE, input_rect, 1 )
             
@@ -344,13 +814,13 @@ class FloatNode( Node ):
             surface.blit( text_surf, ( input_rect.x + 5, input_rect.y + 5 ) )
 
             # Blinking cursor
-            if pygame.time.get_ticks() % 1000 < 500:
+            if input_ticks() % 1000 < 500:
                 cursor_pos = input_rect.x + text_surf.get_width() + 8
                 pygame.draw.line( surface, WHITE, ( cursor_pos, input_rect.y + 5 ), ( cursor_pos, input_rect.y + 18 ) )
         else:
             # --- Display the value on the node ---
             value_surf = font.render( str( self.value ), True, WHITE )
-            value_rect = value_surf.get_rect( center=self.rect.center )
+            value_rect = value_surf.get_rect( center=self.rect.move( offset ).center )
             surface.blit( value_surf, value_rect )
 
 class RndFloatNode( Node ):
@@ -363,12 +833,12 @@ class RndFloatNode( Node ):
     def compute( self ):
         self.values[ "out" ] = self.value
 
-    def draw( self, surface, font ):
-        super().draw( surface, font )
+    def draw( self, surface, font, offset=( 0, 0 ) ):
+        super().draw( surface, font, offset )
         
         # --- Display the value on the node ---
         value_surf = font.render( str( self.value ), True, WHITE )
-        value_rect = value_surf.get_rect( center=self.rect.center )
+        value_rect = value_surf.get_rect( center=self.rect.move( offset ).center )
         surface.blit( value_surf, value_rect )
 
 class StringNode( Node ):
@@ -381,15 +851,16 @@ class StringNode( Node ):
         self.input_text = str( self.value )
         self.last_click_time = 0
 
-    def handle_event( self, event, global_state, connections ):
+    def handle_event( self, event, global_state, graph ):
         # --- Handle keyboard input when in edit mode ---
         if self.editing:
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_RETURN:
                     try:
-                        self.value = str( self.input_text )
+                        value = str( self.input_text )
                     except ValueError:
-                        self.value = "" # Default to empty string if input is invalid
+                        value = "" # Default to empty string if input is invalid
+                    graph.set_value( self, value )
                     self.editing = False
                 elif event.key == pygame.K_BACKSPACE:
                     self.input_text = self.input_text[ :-1 ]
@@ -406,8 +877,8 @@ class StringNode( Node ):
             if self.rect.collidepoint( event.pos ):
                 # Prevent editing when resizing
                 if self.resize_handle_rect.collidepoint(event.pos):
-                    return super().handle_event(event, global_state, connections)
-                current_time = pygame.time.get_ticks()
+                    return super().handle_event(event, global_state, graph)
+                current_time = input_ticks()
                 # Check for double-click (e.g., within 500 milliseconds)
                 if current_time - self.last_click_time < 500:
                     self.editing = True
@@ -419,18 +890,19 @@ class StringNode( Node ):
         # --- Fallback to base class event handling (for dragging, etc.) ---
         # Ensure editing mode doesn't interfere with starting a drag
         if not self.editing:
-            return super().handle_event( event, global_state, connections )
+            return super().handle_event( event, global_state, graph )
         return False
 
     def compute( self ):
         self.values[ "out" ] = self.value
 
-    def draw( self, surface, font ):
-        super().draw( surface, font )
+    def draw( self, surface, font, offset=( 0, 0 ) ):
+        super().draw( surface, font, offset )
         
         if self.editing:
             # --- Draw the input box when editing ---
-            input_rect = pygame.Rect( self.rect.centerx - 40, self.rect.centery - 12, 80, 24 )
+            center = self.rect.move( offset ).center
+            input_rect = pygame.Rect( center[ 0 ] - 40, center[ 1 ] - 12, 80, 24 )
             pygame.draw.rect( surface, INPUT_BOX_COLOR, input_rect )
             pygame.draw.rect( surface, WHITE, input_rect, 1 )
             
@@ -438,56 +910,55 @@ class StringNode( Node ):
             surface.blit( text_surf, ( input_rect.x + 5, input_rect.y + 5 ) )
 
             # Blinking cursor
-            if pygame.time.get_ticks() % 1000 < 500:
+            if input_ticks() % 1000 < 500:
                 cursor_pos = input_rect.x + text_surf.get_width() + 8
                 pygame.draw.line( surface, WHITE, ( cursor_pos, input_rect.y + 5 ), ( cursor_pos, input_rect.y + 18 ) )
         else:
             # --- Display the value on the node ---
             value_surf = font.render( str( self.value ), True, WHITE )
-            value_rect = value_surf.get_rect( center=self.rect.center )
+            value_rect = value_surf.get_rect( center=self.rect.move( offset ).center )
             surface.blit( value_surf, value_rect )
 
 class ArrayNode( Node ):
     def __init__( self, x, y, value=[ 0 ] ):
         super().__init__( x, y, 100, 60, title="Array" )
-        self.value = value
+        self.value = array_from_list( value )
         self.add_output( "out" )
         self._update_socket_positions()
         self.editing = False
-        self.input_text = str( self.value )
+        self.input_text = array_text( self.value )
         self.last_click_time = 0
 
-    def handle_event( self, event, global_state, connections ):
+    def handle_event( self, event, global_state, graph ):
         # --- Handle keyboard input when in edit mode ---
         if self.editing:
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_RETURN:
-                    try:
-                        self.value = self.input_text.split( "," )
-                    except ValueError:
-                        self.value = "" # Default to empty string if input is invalid
+                    graph.set_value( self, parse_array( self.input_text ) )
                     self.editing = False
                 elif event.key == pygame.K_BACKSPACE:
                     self.input_text = self.input_text[ :-1 ]
+                elif event.key == pygame.K_v and event.mod & pygame.KMOD_CTRL:
+                    self.input_text += paste_text() # Paste large arrays from the clipboard
                 else:
                     self.input_text += event.unicode
                 return True # Event handled
 
             if event.type == pygame.MOUSEBUTTONDOWN and not self.rect.collidepoint( event.pos ):
                 self.editing = False # Click outside to cancel editing
-                self.input_text = str( self.value ) # Revert text
+                self.input_text = array_text( self.value ) # Revert text
                 
         # --- Handle mouse clicks for entering edit mode and standard dragging ---
         if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
             if self.rect.collidepoint( event.pos ):
                 # Prevent editing when resizing
                 if self.resize_handle_rect.collidepoint(event.pos):
-                    return super().handle_event(event, global_state, connections)
-                current_time = pygame.time.get_ticks()
+                    return super().handle_event(event, global_state, graph)
+                current_time = input_ticks()
                 # Check for double-click (e.g., within 500 milliseconds)
                 if current_time - self.last_click_time < 500:
                     self.editing = True
-                    self.input_text = str( self.value )
+                    self.input_text = array_text( self.value )
                     self.is_dragging = False # Prevent dragging on double-click
                     return True # Event handled
                 self.last_click_time = current_time
@@ -495,36 +966,82 @@ class ArrayNode( Node ):
         # --- Fallback to base class event handling (for dragging, etc.) ---
         # Ensure editing mode doesn't interfere with starting a drag
         if not self.editing:
-            return super().handle_event( event, global_state, connections )
+            return super().handle_event( event, global_state, graph )
         return False
 
     def compute( self ):
         self.values[ "out" ] = self.value
 
-    def draw( self, surface, font ):
-        super().draw( surface, font )
+    def draw( self, surface, font, offset=( 0, 0 ) ):
+        super().draw( surface, font, offset )
         
         if self.editing:
             # --- Draw the input box when editing ---
-            input_rect = pygame.Rect( self.rect.centerx - 40, self.rect.centery - 12, 80, 24 )
+            center = self.rect.move( offset ).center
+            input_rect = pygame.Rect( center[ 0 ] - 40, center[ 1 ] - 12, 80, 24 )
             pygame.draw.rect( surface, INPUT_BOX_COLOR, input_rect )
             pygame.draw.rect( surface, WHITE, input_rect, 1 )
             
-            text_surf = font.render( self.input_text, True, WHITE )
+            text_surf = font.render( self.input_text[ -12: ], True, WHITE ) # Only the tail fits in the box
             surface.blit( text_surf, ( input_rect.x + 5, input_rect.y + 5 ) )
 
             # Blinking cursor
-            if pygame.time.get_ticks() % 1000 < 500:
+            if input_ticks() % 1000 < 500:
                 cursor_pos = input_rect.x + text_surf.get_width() + 8
                 pygame.draw.line( surface, WHITE, ( cursor_pos, input_rect.y + 5 ), ( cursor_pos, input_rect.y + 18 ) )
         else:
-            # --- Display the value on the node ---
-            value_surf = font.render( str( self.value ), True, WHITE )
-            value_rect = value_surf.get_rect( center=self.rect.center )
-            surface.blit( value_surf, value_rect )
+            # --- Display a cached summary of the value on the node ---
+            self.draw_value( surface, font, self.value, offset )
 
 # --- Arithmetic nodes ---
-class AddNode( Node ):
+class OperatorNode( Node ):
+    # --- Operator whose defaults and kernel follow its inferred input types ---
+    # signature() maps the input types (None for an unconnected input) to the
+    # output type, a kernel specialised for them and the typed defaults of
+    # unconnected inputs, or raises TypeError for inputs the operation rejects.
+    # specialize() also binds each input to the values dict it reads (inputs are
+    # inferred again whenever they are re-linked), so compute() is one call.
+    # An "Error" (zero divisor upstream) reaching an input not inferred as a
+    # string is passed on, so a typed kernel never sees it.
+    kernel = None
+
+    def signature( self, types ):
+        raise NotImplementedError
+
+    def infer( self, input_types ):
+        return { self.output_sockets[ 0 ][ 'name' ]: self.signature( input_types )[ 0 ] }
+
+    def specialize( self, input_types ):
+        output_type, self.kernel, defaults = self.signature( input_types )
+        self.output = self.output_sockets[ 0 ][ 'name' ]
+        self.reads = [] # ( values dict, socket name, default, may carry "Error" ) per input
+        for sock, default, input_type in zip( self.input_sockets, defaults, input_types ):
+            conn = sock[ 'connection' ]
+            if conn:
+                self.reads.append( ( conn[ 'source_node' ].values, conn[ 'source_socket' ][ 'name' ], default, input_type != 'str' ) )
+            else:
+                self.reads.append( ( {}, None, default, False ) )
+
+    def compute( self ):
+        if self.type_error:
+            self.values[ self.output_sockets[ 0 ][ 'name' ] ] = "Error"
+        elif len( self.reads ) == 2:
+            ( values_a, name_a, default_a, guard_a ), ( values_b, name_b, default_b, guard_b ) = self.reads
+            val_a = values_a.get( name_a, default_a )
+            val_b = values_b.get( name_b, default_b )
+            if ( guard_a and val_a.__class__ is str and val_a == "Error" ) or ( guard_b and val_b.__class__ is str and val_b == "Error" ):
+                self.values[ self.output ] = "Error"
+            else:
+                self.values[ self.output ] = self.kernel( val_a, val_b )
+        else:
+            ( values_a, name_a, default_a, guard_a ), = self.reads
+            val_a = values_a.get( name_a, default_a )
+            if guard_a and val_a.__class__ is str and val_a == "Error":
+                self.values[ self.output ] = "Error"
+            else:
+                self.values[ self.output ] = self.kernel( val_a )
+
+class AddNode( OperatorNode ):
     def __init__( self, x, y ):
         super().__init__( x, y, 100, 50, title="Add" )
         self.add_input( "A" )
@@ -532,23 +1049,13 @@ class AddNode( Node ):
         self.add_output( "sum" )
         self._update_socket_positions()
 
-    def compute( self ):
-        val_a = 0
-        val_b = 0
-        # Get value from input A connection
-        if self.input_sockets[ 0 ][ 'connection' ]:
-            source_node = self.input_sockets[ 0 ][ 'connection' ][ 'source_node' ]
-            source_socket_name = self.input_sockets[ 0 ][ 'connection' ][ 'source_socket' ][ 'name' ]
-            val_a = source_node.values.get( source_socket_name, 0 )
-        # Get value from input B connection
-        if self.input_sockets[ 1 ][ 'connection' ]:
-            source_node = self.input_sockets[ 1 ][ 'connection' ][ 'source_node' ]
-            source_socket_name = self.input_sockets[ 1 ][ 'connection' ][ 'source_socket' ][ 'name' ]
-            val_b = source_node.values.get( source_socket_name, 0 )
+    def signature( self, types ):
+        type_a, type_b = _fill_types( types )
+        if type_a == type_b == 'str':
+            return 'str', operator.add, ( "", "" )
+        return _arithmetic_type( self.title, ( type_a, type_b ) ), _pick_kernel( ( type_a, type_b ), operator.add, _ADD ), ( _identity( 0, type_a ), _identity( 0, type_b ) )
 
-        self.values[ "sum" ] = val_a + val_b
-
-class SubtractNode( Node ):
+class SubtractNode( OperatorNode ):
     def __init__( self, x, y ):
         super().__init__( x, y, 100, 50, title="Subtract" )
         self.add_input( "A" )
@@ -556,23 +1063,11 @@ class SubtractNode( Node ):
         self.add_output( "difference" )
         self._update_socket_positions()
 
-    def compute( self ):
-        val_a = 0
-        val_b = 0
-        # Get value from input A connection
-        if self.input_sockets[ 0 ][ 'connection' ]:
-            source_node = self.input_sockets[ 0 ][ 'connection' ][ 'source_node' ]
-            source_socket_name = self.input_sockets[ 0 ][ 'connection' ][ 'source_socket' ][ 'name' ]
-            val_a = source_node.values.get( source_socket_name, 0 )
-        # Get value from input B connection
-        if self.input_sockets[ 1 ][ 'connection' ]:
-            source_node = self.input_sockets[ 1 ][ 'connection' ][ 'source_node' ]
-            source_socket_name = self.input_sockets[ 1 ][ 'connection' ][ 'source_socket' ][ 'name' ]
-            val_b = source_node.values.get( source_socket_name, 0 )
-
-        self.values[ "difference" ] = val_a - val_b
+    def signature( self, types ):
+        type_a, type_b = _fill_types( types )
+        return _arithmetic_type( self.title, ( type_a, type_b ) ), _pick_kernel( ( type_a, type_b ), operator.sub, _SUB ), ( _identity( 0, type_a ), _identity( 0, type_b ) )
 
-class MultiplyNode( Node ):
+class MultiplyNode( OperatorNode ):
     def __init__( self, x, y ):
         super().__init__( x, y, 100, 50, title="Multiply" )
         self.add_input( "A" )
@@ -580,23 +1075,14 @@ class MultiplyNode( Node ):
         self.add_output( "product" )
         self._update_socket_positions()
 
-    def compute( self ):
-        val_a = 0
-        val_b = 0
-        # Get value from input A connection
-        if self.input_sockets[ 0 ][ 'connection' ]:
-            source_node = self.input_sockets[ 0 ][ 'connection' ][ 'source_node' ]
-            source_socket_name = self.input_sockets[ 0 ][ 'connection' ][ 'source_socket' ][ 'name' ]
-            val_a = source_node.values.get( source_socket_name, 0 )
-        # Get value from input B connection
-        if self.input_sockets[ 1 ][ 'connection' ]:
-            source_node = self.input_sockets[ 1 ][ 'connection' ][ 'source_node' ]
-            source_socket_name = self.input_sockets[ 1 ][ 'connection' ][ 'source_socket' ][ 'name' ]
-            val_b = source_node.values.get( source_socket_name, 0 )
-
-        self.values[ "product" ] = val_a * val_b
+    def signature( self, types ):
+        # A string times an integer repeats it
+        if sorted( types, key=str ) in ( [ 'int', 'str' ], [ 'bool', 'str' ], [ None, 'str' ] ):
+            return 'str', operator.mul, ( 1, 1 )
+        type_a, type_b = _fill_types( types )
+        return _arithmetic_type( self.title, ( type_a, type_b ) ), _pick_kernel( ( type_a, type_b ), operator.mul, _MUL ), ( _identity( 1, type_a ), _identity( 1, type_b ) )
 
-class FullDivideNode( Node ):
+class FullDivideNode( OperatorNode ):
     def __init__( self, x, y ):
         super().__init__( x, y, 100, 50, title="Full Divide" )
         self.add_input( "A" )
@@ -604,26 +1090,14 @@ class FullDivideNode( Node ):
         self.add_output( "quotient" )
         self._update_socket_positions()
 
-    def compute( self ):
-        val_a = 1
-        val_b = 1
-        # Get value from input A connection
-        if self.input_sockets[ 0 ][ 'connection' ]:
-            source_node = self.input_sockets[ 0 ][ 'connection' ][ 'source_node' ]
-            source_socket_name = self.input_sockets[ 0 ][ 'connection' ][ 'source_socket' ][ 'name' ]
-            val_a = source_node.values.get( source_socket_name, 0 )
-        # Get value from input B connection
-        if self.input_sockets[ 1 ][ 'connection' ]:
-            source_node = self.input_sockets[ 1 ][ 'connection' ][ 'source_node' ]
-            source_socket_name = self.input_sockets[ 1 ][ 'connection' ][ 'source_socket' ][ 'name' ]
-            val_b = source_node.values.get( source_socket_name, 0 )
-        
-        if val_b != 0:
-            self.values[ "quotient" ] = val_a / val_b
-        else:
-            self.values[ "quotient" ] = "Error"
+    def signature( self, types ):
+        type_a, type_b = _fill_types( types )
+        result = _arithmetic_type( self.title, ( type_a, type_b ) )
+        if result in ARRAY_TYPES:
+            result = 'float array'
+        return ( 'float' if result in NUMBER_TYPES else result ), _divide_kernel( ( type_a, type_b ), operator.truediv, _scalar_truediv ), ( _identity( 1, type_a ), _identity( 1, type_b ) )
 
-class ModDivideNode( Node ):
+class ModDivideNode( OperatorNode ):
     def __init__( self, x, y ):
         super().__init__( x, y, 100, 50, title="Mod Divide" )
         self.add_input( "A" )
@@ -631,26 +1105,11 @@ class ModDivideNode( Node ):
         self.add_output( "remainder" )
         self._update_socket_positions()
 
-    def compute( self ):
-        val_a = 1
-        val_b = 1
-        # Get value from input A connection
-        if self.input_sockets[ 0 ][ 'connection' ]:
-            source_node = self.input_sockets[ 0 ][ 'connection' ][ 'source_node' ]
-            source_socket_name = self.input_sockets[ 0 ][ 'connection' ][ 'source_socket' ][ 'name' ]
-            val_a = source_node.values.get( source_socket_name, 0 )
-        # Get value from input B connection
-        if self.input_sockets[ 1 ][ 'connection' ]:
-            source_node = self.input_sockets[ 1 ][ 'connection' ][ 'source_node' ]
-            source_socket_name = self.input_sockets[ 1 ][ 'connection' ][ 'source_socket' ][ 'name' ]
-            val_b = source_node.values.get( source_socket_name, 0 )
-        
-        if val_b != 0:
-            self.values[ "remainder" ] = val_a % val_b
-        else:
-            self.values[ "remainder" ] = "Error"
+    def signature( self, types ):
+        type_a, type_b = _fill_types( types )
+        return _divided_array_type( _arithmetic_type( self.title, ( type_a, type_b ) ) ), _divide_kernel( ( type_a, type_b ), operator.mod, _scalar_mod ), ( _identity( 1, type_a ), _identity( 1, type_b ) )
 
-class IntDivideNode( Node ):
+class IntDivideNode( OperatorNode ):
     def __init__( self, x, y ):
         super().__init__( x, y, 100, 50, title="Int Divide" )
         self.add_input( "A" )
@@ -658,26 +1117,27 @@ class IntDivideNode( Node ):
         self.add_output( "quotient" )
         self._update_socket_positions()
 
-    def compute( self ):
-        val_a = 1
-        val_b = 1
-        # Get value from input A connection
-        if self.input_sockets[ 0 ][ 'connection' ]:
-            source_node = self.input_sockets[ 0 ][ 'connection' ][ 'source_node' ]
-            source_socket_name = self.input_sockets[ 0 ][ 'connection' ][ 'source_socket' ][ 'name' ]
-            val_a = source_node.values.get( source_socket_name, 0 )
-        # Get value from input B connection
-        if self.input_sockets[ 1 ][ 'connection' ]:
-            source_node = self.input_sockets[ 1 ][ 'connection' ][ 'source_node' ]
-            source_socket_name = self.input_sockets[ 1 ][ 'connection' ][ 'source_socket' ][ 'name' ]
-            val_b = source_node.values.get( source_socket_name, 0 )
-        
-        if val_b != 0:
-            self.values[ "quotient" ] = val_a // val_b
-        else:
-            self.values[ "quotient" ] = "Error"
+    def signature( self, types ):
+        type_a, type_b = _fill_types( types )
+        return _divided_array_type( _arithmetic_type( self.title, ( type_a, type_b ) ) ), _divide_kernel( ( type_a, type_b ), operator.floordiv, _scalar_floordiv ), ( _identity( 1, type_a ), _identity( 1, type_b ) )
+
+def _power( val_a, val_b ):
+    if _is_array( val_a ) or _is_array( val_b ):
+        numpy = _numpy()
+        with numpy.errstate( divide="ignore", invalid="ignore" ): # 0 ** -n is inf, like a zero divisor; (-8) ** 0.5 is NaN
+            if numpy.any( numpy.asarray( val_b ) < 0 ):
+                return numpy.float_power( val_a, val_b ) # NumPy refuses negative integer powers
+            return val_a ** val_b
+    return val_a ** val_b
+
+# Kernels for inputs that may be arrays
+_ADD = _elementwise( _numeric( operator.add ), operator.add )
+_SUB = _elementwise( _numeric( operator.sub ), operator.sub )
+_MUL = _elementwise( _numeric( operator.mul ), operator.mul )
+_POW = _elementwise( _numeric( _power ), _item_power )
+_ABS = _elementwise_unary( _numeric( abs ), abs )
 
-class ExponentNode( Node ):
+class ExponentNode( OperatorNode ):
     def __init__( self, x, y ):
         super().__init__( x, y, 100, 50, title="Exponent" )
         self.add_input( "A" )
@@ -685,42 +1145,68 @@ class ExponentNode( Node ):
         self.add_output( "out" )
         self._update_socket_positions()
 
-    def compute( self ):
-        val_a = 1
-        val_b = 1
-        # Get value from input A connection
-        if self.input_sockets[ 0 ][ 'connection' ]:
-            source_node = self.input_sockets[ 0 ][ 'connection' ][ 'source_node' ]
-            source_socket_name = self.input_sockets[ 0 ][ 'connection' ][ 'source_socket' ][ 'name' ]
-            val_a = source_node.values.get( source_socket_name, 0 )
-        # Get value from input B connection
-        if self.input_sockets[ 1 ][ 'connection' ]:
-            source_node = self.input_sockets[ 1 ][ 'connection' ][ 'source_node' ]
-            source_socket_name = self.input_sockets[ 1 ][ 'connection' ][ 'source_socket' ][ 'name' ]
-            val_b = source_node.values.get( source_socket_name, 0 )
-        
-        self.values[ "out" ] = val_a ** val_b
+    def signature( self, types ):
+        type_a, type_b = _fill_types( types )
+        result = _arithmetic_type( self.title, ( type_a, type_b ) )
+        if result in NUMBER_TYPES:
+            # Negative integer exponents give floats
+            return ( 'float' if result == 'float' else 'number' ), operator.pow, ( _identity( 1, type_a ), _identity( 1, type_b ) )
+        if result in ARRAY_TYPES:
+            result = 'float array' if result == 'float array' else 'number array'
+        return result, _POW, ( _identity( 1, type_a ), _identity( 1, type_b ) )
 
-class AbsNode( Node ):
+class AbsNode( OperatorNode ):
     def __init__( self, x, y ):
         super().__init__( x, y, 130, 50, title="Absolute Value" )
         self.add_input( "A" )
         self.add_output( "out" )
         self._update_socket_positions()
 
-    def compute( self ):
-        val_a = 1
-        # Get value from input A connection
-        if self.input_sockets[ 0 ][ 'connection' ]:
-            source_node = self.input_sockets[ 0 ][ 'connection' ][ 'source_node' ]
-            source_socket_name = self.input_sockets[ 0 ][ 'connection' ][ 'source_socket' ][ 'name' ]
-            val_a = source_node.values.get( source_socket_name, 0 )
-        # Get value from input B connection
-        
-        self.values[ "out" ] = abs( val_a )
+    def signature( self, types ):
+        type_a, = _fill_types( types )
+        result = _arithmetic_type( self.title, ( type_a, ) )
+        if _element_type( result ) == 'bool':
+            result = 'int array' if result in ARRAY_TYPES else 'int'
+        return result, _pick_kernel( ( type_a, ), abs, _ABS ), ( _identity( 0, type_a ), )
 
 # --- Logic nodes ---
-class AndNode( Node ):
+def _and( val_a, val_b ):
+    if _is_array( val_a ) or _is_array( val_b ):
+        return _numpy().where( val_a, val_b, val_a ) # Element-wise "a and b"
+    return val_a and val_b
+
+def _or( val_a, val_b ):
+    if _is_array( val_a ) or _is_array( val_b ):
+        return _numpy().where( val_a, val_a, val_b ) # Element-wise "a or b"
+    return val_a or val_b
+
+def _not( val_a ):
+    if _is_array( val_a ):
+        return _numpy().logical_not( val_a )
+    return not val_a
+
+def _logic_signature( name, types, identity, kernel, scalar_kernel ):
+    # "and"/"or" return one of their operands, so any scalar types combine;
+    # arrays only hold numbers, since NumPy cannot take the truth of text items
+    type_a, type_b = _fill_types( types )
+    defaults = ( _identity( identity, type_a ), _identity( identity, type_b ) )
+    if ANY in ( type_a, type_b ):
+        return ANY, kernel, defaults
+    if type_a in ARRAY_TYPES or type_b in ARRAY_TYPES:
+        element_a, element_b = _element_type( type_a ), _element_type( type_b )
+        if element_a not in NUMBER_TYPES or element_b not in NUMBER_TYPES:
+            raise TypeError( "%s cannot take %s and %s" % ( name, type_a, type_b ) )
+        return _array_type( element_a if element_a == element_b else 'number' ), kernel, defaults
+    if type_a == type_b:
+        return type_a, scalar_kernel, defaults
+    return ( 'number' if type_a in NUMBER_TYPES and type_b in NUMBER_TYPES else ANY ), scalar_kernel, defaults
+
+_AND = _elementwise( _and, lambda val_a, val_b: val_a and val_b )
+_OR = _elementwise( _or, lambda val_a, val_b: val_a or val_b )
+_XOR = _elementwise( operator.xor, operator.xor )
+_NOT = _elementwise_unary( _not, operator.not_ )
+
+class AndNode( OperatorNode ):
     def __init__( self, x, y ):
         super().__init__( x, y, 100, 50, title="And" )
         self.add_input( "A" )
@@ -728,23 +1214,10 @@ class AndNode( Node ):
         self.add_output( "out" )
         self._update_socket_positions()
 
-    def compute( self ):
-        val_a = 0
-        val_b = 0
-        # Get value from input A connection
-        if self.input_sockets[ 0 ][ 'connection' ]:
-            source_node = self.input_sockets[ 0 ][ 'connection' ][ 'source_node' ]
-            source_socket_name = self.input_sockets[ 0 ][ 'connection' ][ 'source_socket' ][ 'name' ]
-            val_a = source_node.values.get( source_socket_name, 0 )
-        # Get value from input B connection
-        if self.input_sockets[ 1 ][ 'connection' ]:
-            source_node = self.input_sockets[ 1 ][ 'connection' ][ 'source_node' ]
-            source_socket_name = self.input_sockets[ 1 ][ 'connection' ][ 'source_socket' ][ 'name' ]
-            val_b = source_node.values.get( source_socket_name, 0 )
-        
-        self.values[ "out" ] = val_a and val_b
+    def signature( self, types ):
+        return _logic_signature( self.title, types, 1, _AND, lambda val_a, val_b: val_a and val_b )
 
-class OrNode( Node ):
+class OrNode( OperatorNode ):
     def __init__( self, x, y ):
         super().__init__( x, y, 100, 50, title="Or" )
         self.add_input( "A" )
@@ -752,23 +1225,10 @@ class OrNode( Node ):
         self.add_output( "out" )
         self._update_socket_positions()
 
-    def compute( self ):
-        val_a = 0
-        val_b = 0
-        # Get value from input A connection
-        if self.input_sockets[ 0 ][ 'connection' ]:
-            source_node = self.input_sockets[ 0 ][ 'connection' ][ 'source_node' ]
-            source_socket_name = self.input_sockets[ 0 ][ 'connection' ][ 'source_socket' ][ 'name' ]
-            val_a = source_node.values.get( source_socket_name, 0 )
-        # Get value from input B connection
-        if self.input_sockets[ 1 ][ 'connection' ]:
-            source_node = self.input_sockets[ 1 ][ 'connection' ][ 'source_node' ]
-            source_socket_name = self.input_sockets[ 1 ][ 'connection' ][ 'source_socket' ][ 'name' ]
-            val_b = source_node.values.get( source_socket_name, 0 )
+    def signature( self, types ):
+        return _logic_signature( self.title, types, 0, _OR, lambda val_a, val_b: val_a or val_b )
         
-        self.values[ "out" ] = val_a or val_b
-        
-class XorNode( Node ):
+class XorNode( OperatorNode ):
     def __init__( self, x, y ):
         super().__init__( x, y, 100, 50, title="Xor" )
         self.add_input( "A" )
@@ -776,63 +1236,82 @@ class XorNode( Node ):
         self.add_output( "out" )
         self._update_socket_positions()
 
-    def compute( self ):
-        val_a = 0
-        val_b = 0
-        # Get value from input A connection
-        if self.input_sockets[ 0 ][ 'connection' ]:
-            source_node = self.input_sockets[ 0 ][ 'connection' ][ 'source_node' ]
-            source_socket_name = self.input_sockets[ 0 ][ 'connection' ][ 'source_socket' ][ 'name' ]
-            val_a = source_node.values.get( source_socket_name, 0 )
-        # Get value from input B connection
-        if self.input_sockets[ 1 ][ 'connection' ]:
-            source_node = self.input_sockets[ 1 ][ 'connection' ][ 'source_node' ]
-            source_socket_name = self.input_sockets[ 1 ][ 'connection' ][ 'source_socket' ][ 'name' ]
-            val_b = source_node.values.get( source_socket_name, 0 )
-        
-        self.values[ "out" ] = val_a ^ val_b
+    def signature( self, types ):
+        type_a, type_b = _fill_types( types )
+        defaults = ( _identity( 0, type_a ), _identity( 0, type_b ) )
+        if ANY in ( type_a, type_b ):
+            return ANY, _XOR, defaults
+        element_a, element_b = _element_type( type_a ), _element_type( type_b )
+        if element_a in ( 'bool', 'int' ) and element_b in ( 'bool', 'int' ):
+            result = 'bool' if element_a == element_b == 'bool' else 'int'
+            if type_a in ARRAY_TYPES or type_b in ARRAY_TYPES:
+                return _array_type( result ), _XOR, defaults
+            return result, operator.xor, defaults
+        raise TypeError( "%s cannot take %s and %s" % ( self.title, type_a, type_b ) )
 
-class NotNode( Node ):
+class NotNode( OperatorNode ):
     def __init__( self, x, y ):
         super().__init__( x, y, 100, 50, title="Not" )
         self.add_input( "in" )
         self.add_output( "out" )
         self._update_socket_positions()
 
-    def compute( self ):
-        val_a = 0
-        # Get value from input A connection
-        if self.input_sockets[ 0 ][ 'connection' ]:
-            source_node = self.input_sockets[ 0 ][ 'connection' ][ 'source_node' ]
-            source_socket_name = self.input_sockets[ 0 ][ 'connection' ][ 'source_socket' ][ 'name' ]
-            val_a = source_node.values.get( source_socket_name, 0 )
-        
-        self.values[ "out" ] = not val_a
+    def signature( self, types ):
+        type_a, = _fill_types( types )
+        if type_a == ANY:
+            return ANY, _NOT, ( 0, )
+        if type_a in ARRAY_TYPES:
+            if _element_type( type_a ) not in NUMBER_TYPES:
+                raise TypeError( "%s cannot take %s" % ( self.title, type_a ) )
+            return 'bool array', _NOT, ( 0, )
+        return 'bool', operator.not_, ( _identity( 0, type_a ), )
 
 # --- String nodes ---
-class ConcatNode( Node ):
+class ConcatNode( OperatorNode ):
+    # Chains of Concatenate nodes on strings are joined in one step: a node whose
+    # only consumer is another joinable Concatenate is fused into it (Graph sets
+    # fused) and skips computing, and the end of the chain gathers every piece
+    # with one str.join, instead of copying the growing string at every step.
     def __init__( self, x, y ):
         super().__init__( x, y, 100, 50, title="Concatenate" )
         self.add_input( "A" )
         self.add_input( "B" )
         self.add_output( "new_string" )
         self._update_socket_positions()
+        self.joinable = False # Both inputs are strings
+        self.fused = False
 
-    def compute( self ):
-        val_a = ""
-        val_b = ""
-        # Get value from input A connection
-        if self.input_sockets[ 0 ][ 'connection' ]:
-            source_node = self.input_sockets[ 0 ][ 'connection' ][ 'source_node' ]
-            source_socket_name = self.input_sockets[ 0 ][ 'connection' ][ 'source_socket' ][ 'name' ]
-            val_a = source_node.values.get( source_socket_name, 0 )
-        # Get value from input B connection
-        if self.input_sockets[ 1 ][ 'connection' ]:
-            source_node = self.input_sockets[ 1 ][ 'connection' ][ 'source_node' ]
-            source_socket_name = self.input_sockets[ 1 ][ 'connection' ][ 'source_socket' ][ 'name' ]
-            val_b = source_node.values.get( source_socket_name, 0 )
+    def signature( self, types ):
+        type_a, type_b = _fill_types( types, 'str' )
+        if type_a == type_b == 'str':
+            return 'str', operator.add, ( "", "" )
+        if all( t in ( 'str', ANY ) for t in ( type_a, type_b ) ):
+            return ANY, operator.add, ( "", "" )
+        raise TypeError( "%s needs strings, not %s" % ( self.title, type_a if type_a != 'str' else type_b ) )
 
-        self.values[ "new_string" ] = val_a + val_b
+    def specialize( self, input_types ):
+        super().specialize( input_types )
+        self.joinable = self.signature( input_types )[ 0 ] == 'str'
+
+    def compute( self ):
+        if self.fused:
+            return # The Concatenate consuming this one reads its inputs directly
+        if self.type_error or not self.joinable:
+            super().compute()
+            return
+        parts = []
+        stack = self.input_sockets[ ::-1 ]
+        while stack:
+            sock = stack.pop()
+            conn = sock[ 'connection' ]
+            if conn is None:
+                continue # Default ""
+            source_node = conn[ 'source_node' ]
+            if isinstance( source_node, ConcatNode ) and source_node.fused:
+                stack.extend( source_node.input_sockets[ ::-1 ] )
+            else:
+                parts.append( source_node.values.get( conn[ 'source_socket' ][ 'name' ], "" ) )
+        self.values[ "new_string" ] = "".join( parts )
 
 # --- Output nodes ---
 class DisplayNode( Node ):
@@ -851,16 +1330,14 @@ class DisplayNode( Node ):
         else:
             self.display_value = "None"
 
-    def draw( self, surface, font ):
-        super().draw( surface, font )
-        # Display the computed value on the node
-        display_text = str( self.display_value )
-        if isinstance(self.display_value, float):
-             display_text = f"{self.display_value:.2f}" # Format floats nicely
+    def release( self ):
+        super().release()
+        self.display_value = "None"
 
-        value_surf = font.render( display_text, True, WHITE )
-        value_rect = value_surf.get_rect( center=self.rect.center )
-        surface.blit( value_surf, value_rect )
+    def draw( self, surface, font, offset=( 0, 0 ) ):
+        super().draw( surface, font, offset )
+        # Display the computed value on the node
+        self.draw_value( surface, font, self.display_value, offset )
         
 class PreviewNode( Node ):
     def __init__( self, x, y ):
@@ -883,129 +1360,2559 @@ class PreviewNode( Node ):
         
         self.values[ "out" ] = val_a
 
-    def draw( self, surface, font ):
-        super().draw( surface, font )
+    def infer( self, input_types ):
+        return { "out": input_types[ 0 ] or 'int' }
+
+    def release( self ):
+        super().release()
+        self.display_value = "None"
+
+    def draw( self, surface, font, offset=( 0, 0 ) ):
+        super().draw( surface, font, offset )
         # Display the computed value on the node
-        display_text = str( self.display_value )
-        if isinstance(self.display_value, float):
-             display_text = f"{self.display_value:.2f}" # Format floats nicely
+        self.draw_value( surface, font, self.display_value, offset )
 
-        value_surf = font.render( display_text, True, WHITE )
-        value_rect = value_surf.get_rect( center=self.rect.center )
-        surface.blit( value_surf, value_rect )
+# --- Async I/O nodes ---
+# File, subprocess and socket work would block the frame loop inside compute().
+# In the editor, Graph.evaluate() hands these nodes to the AsyncRunner instead;
+# its asyncio loop runs the request in the background and the result comes back
+# into the graph as a 'deliver' change, so only the consumers recompute. Without
+# a runner (server, Monte Carlo, --evaluate) compute() runs the request inline.
+IO_TIMEOUT = 30.0 # Seconds before a request is abandoned
+IO_ERRORS = ( OSError, ValueError, asyncio.TimeoutError )
 
-# --- Main Application ---
-def main():
-    pygame.init()
-    pygame.font.init()
-    font = pygame.font.SysFont( None, 24 )
-    small_font = pygame.font.SysFont( None, 20 )
+class AsyncNode( Node ):
+    defaults = () # Value of each input socket while unconnected
+    result_type = ANY
+    side_effects = True # Running the request changes something outside the graph
 
-    SCREEN_WIDTH = 1200
-    SCREEN_HEIGHT = 800
-    screen = pygame.display.set_mode( ( SCREEN_WIDTH, SCREEN_HEIGHT ) )
-    pygame.display.set_caption( "ViPr - Visual Programmer" )
+    def __init__( self, x, y, title ):
+        super().__init__( x, y, 120, 60, title=title )
+        self.request = 0 # Bumped per request, so results of superseded requests are dropped
+        self.status = "idle" # Shown instead of the result while running or failed
 
-    nodes = [ # --- Default nodes on opening ---
-        IntegerNode( 100, 100, value=5 ),
-        IntegerNode( 100, 250, value=10 ),
-        AddNode( 350, 150 ),
-        DisplayNode( 600, 150 )
-    ]
-    connections = []
+    def input_values( self ):
+        values = []
+        for sock, default in zip( self.input_sockets, self.defaults ):
+            if sock[ 'connection' ]:
+                source_node = sock[ 'connection' ][ 'source_node' ]
+                values.append( source_node.values.get( sock[ 'connection' ][ 'source_socket' ][ 'name' ], default ) )
+            else:
+                values.append( default )
+        return values
 
-    global_connection_state = {
-        'is_drawing_connection': False,
-        'connection_start_node': None,
-        'connection_start_socket': None,
-    }
-    
-    context_menu = None
-    
-    # --- Track which node is being edited ---
-    editing_node = None
+    def infer( self, input_types ):
+        return { sock[ 'name' ]: self.result_type for sock in self.output_sockets }
 
-    running = True
-    clock = pygame.time.Clock()
+    async def run( self, *inputs ):
+        # Returns the new output values by socket name
+        raise NotImplementedError
 
-    while running:
-        mouse_pos = pygame.mouse.get_pos()
-        
-        # --- Determine which node is being edited ---
-        editing_node = None
-        for n in nodes:
-            if isinstance( n, (IntegerNode, FloatNode, StringNode, ArrayNode) ) and n.editing:
-                editing_node = n
-                break
+    def compute( self ):
+        self.request += 1
+        try:
+            values = asyncio.run( asyncio.wait_for( self.run( *self.input_values() ), IO_TIMEOUT ) )
+        except IO_ERRORS as error:
+            self.fail( error )
+            return
+        self.values.update( values )
+        self.status = None
 
-        # --- Event Handling ---
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-                
-            # --- Pass keyboard events to the editing node FIRST ---
-            if editing_node:
-                editing_node.handle_event( event, global_connection_state, connections )
-                # If a click happens, check if it's outside the editing node to close it
-                if event.type == pygame.MOUSEBUTTONDOWN and not editing_node.rect.collidepoint( event.pos ):
-                    editing_node.editing = False
-                    editing_node.input_text = str( editing_node.value ) # revert
-                continue # Skip other handlers if we are editing
+    def fail( self, error ):
+        self.status = "error: %s" % ( str( error ) or type( error ).__name__ )
 
-            # --- DELETE NODE with Delete Key ---
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_DELETE:
-                    node_to_delete = None
-                    for node in nodes:
-                        if node.rect.collidepoint( mouse_pos ):
-                            node_to_delete = node
-                            break # Found the node to delete
-                    
-                    if node_to_delete:
-                        # Remove connections associated with this node
-                        connections[:] = [ c for c in connections if c[ 'source_node' ] != node_to_delete and c[ 'target_node' ] != node_to_delete ]
-                        
-                        # Unlink from any nodes that were targeting it
-                        for n in nodes:
-                            if n == node_to_delete: continue
-                            for s in n.input_sockets:
-                                if s[ 'connection' ] and s[ 'connection' ][ 'source_node' ] == node_to_delete:
-                                    s[ 'connection' ] = None
-                        
-                        nodes.remove( node_to_delete )
-                        continue # Event handled
+    def release( self ):
+        super().release()
+        self.request += 1 # A request still in flight no longer has anywhere to go
+        self.status = "idle"
 
-            # --- Context Menu Handling ---
-            if context_menu:
-                if context_menu.handle_event( event ):
-                    context_menu = None # Close menu after action
-                    continue # Skip other event handling
+    def draw( self, surface, font, offset=( 0, 0 ) ):
+        super().draw( surface, font, offset )
+        if self.status is None:
+            self.draw_value( surface, font, self.values[ self.output_sockets[ 0 ][ 'name' ] ], offset )
+        else:
+            self.draw_value( surface, font, self.status, offset )
 
-            # --- Finalize Connection ---
-            if event.type == pygame.MOUSEBUTTONUP and event.button == 1 and global_connection_state[ 'is_drawing_connection' ]:
-                target_found = False
-                for node in nodes:
-                    for sock in node.input_sockets:
-                        if sock[ 'rect' ].collidepoint( event.pos ) and sock[ 'connection' ] is None:
-                            # Create connection
-                            new_conn = {
-                                'source_node': global_connection_state[ 'connection_start_node' ],
-                                'source_socket': global_connection_state[ 'connection_start_socket' ],
-                                'target_node': node,
-                                'target_socket': sock
-                            }
-                            connections.append( new_conn )
-                            sock[ 'connection' ] = new_conn # Link locally
-                            target_found = True
-                            break
-                    if target_found: break
-                
+def _read_text( path ):
+    with open( path ) as f:
+        return f.read()
+
+def _write_text( path, text ):
+    with open( path, "w" ) as f:
+        return f.write( text )
+
+class ReadFileNode( AsyncNode ):
+    defaults = ( "", )
+    result_type = 'str'
+    side_effects = False
+
+    def __init__( self, x, y ):
+        super().__init__( x, y, title="Read File" )
+        self.add_input( "path" )
+        self.add_output( "text" )
+        self.values[ "text" ] = ""
+        self._update_socket_positions()
+
+    async def run( self, path ):
+        if not path:
+            raise ValueError( "no path" )
+        return { "text": await asyncio.to_thread( _read_text, str( path ) ) }
+
+class WriteFileNode( AsyncNode ):
+    defaults = ( "", "" )
+    result_type = 'int'
+
+    def __init__( self, x, y ):
+        super().__init__( x, y, title="Write File" )
+        self.add_input( "path" )
+        self.add_input( "text" )
+        self.add_output( "written" )
+        self._update_socket_positions()
+
+    async def run( self, path, text ):
+        if not path:
+            raise ValueError( "no path" )
+        return { "written": await asyncio.to_thread( _write_text, str( path ), str( text ) ) }
+
+class CommandNode( AsyncNode ):
+    # Runs a program (no shell) and outputs what it printed
+    defaults = ( "", )
+    result_type = 'str'
+
+    def __init__( self, x, y ):
+        super().__init__( x, y, title="Command" )
+        self.add_input( "command" )
+        self.add_output( "stdout" )
+        self.values[ "stdout" ] = ""
+        self._update_socket_positions()
+
+    async def run( self, command ):
+        args = shlex.split( str( command ) )
+        if not args:
+            raise ValueError( "no command" )
+        process = await asyncio.create_subprocess_exec( *args, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE )
+        try:
+            stdout, stderr = await process.communicate()
+        except asyncio.CancelledError: # Superseded or timed out
+            process.kill()
+            await process.wait()
+            raise
+        if process.returncode:
+            raise OSError( stderr.decode( errors="replace" ).strip() or "exit status %d" % process.returncode )
+        return { "stdout": stdout.decode( errors="replace" ) }
+
+class SocketNode( AsyncNode ):
+    # Sends the message to a local TCP port and outputs the reply (read until the peer closes)
+    defaults = ( 0, "" )
+    result_type = 'str'
+
+    def __init__( self, x, y ):
+        super().__init__( x, y, title="Socket" )
+        self.add_input( "port" )
+        self.add_input( "message" )
+        self.add_output( "reply" )
+        self.values[ "reply" ] = ""
+        self._update_socket_positions()
+
+    async def run( self, port, message ):
+        reader, writer = await asyncio.open_connection( "127.0.0.1", int( port ) )
+        try:
+            writer.write( str( message ).encode() )
+            await writer.drain()
+            writer.write_eof()
+            reply = await reader.read()
+        finally:
+            writer.close()
+        return { "reply": reply.decode( errors="replace" ) }
+
+# --- Group nodes ---
+class GroupInputNode( Node ):
+    # Stands in for a group input socket inside the group's inner graph
+    def __init__( self, x, y, name ):
+        super().__init__( x, y, 100, 50, title=name )
+        self.add_output( "out" )
+        self._update_socket_positions()
+
+class GroupDefinition:
+    # --- Inner graph shared by every GroupNode instance of one group ---
+    MAX_CACHED_RESULTS = 256
+
+    def __init__( self, name, graph, inputs, outputs ):
+        self.name = name
+        self.graph = graph
+        self.inputs = inputs # GroupInputNode per group input socket
+        self.outputs = outputs # ( inner node, socket name ) per group output socket
+        self.results = {} # Input values -> output values
+        self.plan = None
+        graph.keep.update( node for node, name in outputs )
+
+    def compile( self ):
+        # Proxies are filled in directly, so only the real nodes are computed
+        self.plan = [ node.compute for node in self.graph.evaluation_order() if not isinstance( node, GroupInputNode ) ]
+        self.results.clear()
+
+    def evaluate( self, input_values ):
+        if self.plan is None:
+            self.compile()
+        self.graph.infer_types() # Only does something after the inner constants were replaced (Monte Carlo)
+
+        # Identical inputs (from any instance) reuse the previous result
+        try:
+            key = tuple( ( type( value ), value ) for value in input_values )
+            hash( key )
+        except TypeError:
+            key = None # Unhashable values (e.g. lists) are always recomputed
+        if key is not None and key in self.results:
+            return self.results[ key ]
+
+        for proxy, value in zip( self.inputs, input_values ):
+            proxy.values[ "out" ] = value
+        for compute in self.plan:
+            compute()
+        outputs = tuple( node.values.get( name, 0 ) for node, name in self.outputs )
+
+        if key is not None:
+            if len( self.results ) >= self.MAX_CACHED_RESULTS:
+                self.results.clear()
+            self.results[ key ] = outputs
+        return outputs
+
+class GroupNode( Node ):
+    body_color = GROUP_BODY_COLOR
+
+    def __init__( self, x, y, definition ):
+        socket_count = max( len( definition.inputs ), len( definition.outputs ) )
+        super().__init__( x, y, 120, max( 60, 20 * ( socket_count + 1 ) ), title=definition.name )
+        self.definition = definition
+        taken = set()
+        for proxy in definition.inputs:
+            self.add_input( proxy.title )
+        for node, name in definition.outputs:
+            self.add_output( _unique_name( name, taken ) )
+        self._update_socket_positions()
+        self.last_inputs = None
+
+    def compute( self ):
+        input_values = []
+        for sock in self.input_sockets:
+            if sock[ 'connection' ]:
+                source_node = sock[ 'connection' ][ 'source_node' ]
+                source_socket_name = sock[ 'connection' ][ 'source_socket' ][ 'name' ]
+                input_values.append( source_node.values.get( source_socket_name, 0 ) )
+            else:
+                input_values.append( 0 )
+
+        # Skip the inner graph entirely while the very same input objects are connected
+        if self.last_inputs is not None and len( self.last_inputs ) == len( input_values ) \
+                and all( a is b for a, b in zip( self.last_inputs, input_values ) ):
+            return
+        self.last_inputs = input_values
+
+        outputs = self.definition.evaluate( input_values )
+        for sock, value in zip( self.output_sockets, outputs ):
+            self.values[ sock[ 'name' ] ] = value
+
+    def release( self ):
+        super().release()
+        self.last_inputs = None # Upstream values
+
+    def draw( self, surface, font, offset=( 0, 0 ) ):
+        super().draw( surface, font, offset )
+        count_surf = font.render( "%d nodes" % len( self.definition.graph.nodes ), True, WHITE )
+        center = self.rect.move( offset ).center
+        count_rect = count_surf.get_rect( center=( center[ 0 ], center[ 1 ] + 8 ) )
+        surface.blit( count_surf, count_rect )
+
+def _unique_name( name, taken ):
+    unique = name
+    suffix = 2
+    while unique in taken:
+        unique = "%s%d" % ( name, suffix )
+        suffix += 1
+    taken.add( unique )
+    return unique
+
+# --- Graph ---
+class Graph:
+    # --- Nodes and the connections between their sockets ---
+    # Connections are only accepted if they keep the graph acyclic. A topological
+    # order is maintained incrementally (Pearce-Kelly), so a new connection only
+    # visits the nodes ordered between its two endpoints.
+    # Every change is reported to the listeners as a small dict (see History).
+    def __init__( self, nodes=() ):
+        self.nodes = []
+        self.by_id = {} # Node id -> node, so transient state can hold ids instead of nodes
+        self.connections = []
+        self.definitions = [] # GroupDefinitions available to this graph
+        self.order = {} # Node -> position in the topological order
+        self.next_order = 0
+        self.dirty = set() # Nodes to recompute on the next evaluate()
+        self.untyped = set() # Nodes whose types to infer again before the next evaluate()
+        self.keep = set() # Nodes whose values are read from outside (group outputs), never fused away
+        self.held = set() # AsyncNodes the next evaluate() passes over, keeping their current outputs
+        self.listeners = []
+        self.version = 0 # Bumped whenever the set of connections changes
+        self.result_cache = None # Optional ResultCache consulted by evaluate()
+        self.async_runner = None # Optional AsyncRunner that evaluate() hands AsyncNodes to
+        self._evaluation_order = None
+        for node in nodes:
+            self.add_node( node )
+
+    def _emit( self, change ):
+        for listener in self.listeners:
+            listener( change )
+
+    def find_node( self, node_id ):
+        return self.by_id.get( node_id )
+
+    def add_node( self, node ):
+        self.nodes.append( node )
+        self.by_id[ node.id ] = node
+        self.order[ node ] = self.next_order # New nodes have no connections yet, so last is always valid
+        self.next_order += 1
+        self._evaluation_order = None
+        self.dirty.add( node )
+        self.untyped.add( node )
+        self._emit( { 'op': 'add_node', 'node': node } )
+        return node
+
+    def _cut( self, nodes ):
+        # Unlink every connection touching the nodes with one pass over the connection list
+        doomed = {}
+        for node in nodes:
+            for sock in node.input_sockets:
+                if sock[ 'connection' ]:
+                    doomed[ id( sock[ 'connection' ] ) ] = sock[ 'connection' ]
+            for sock in node.output_sockets:
+                for conn in sock[ 'connections' ]:
+                    doomed[ id( conn ) ] = conn
+        if doomed:
+            self.connections[:] = [ conn for conn in self.connections if id( conn ) not in doomed ]
+            for conn in doomed.values():
+                self._unlink( conn )
+        return list( doomed.values() )
+
+    def _forget_node( self, node ):
+        del self.by_id[ node.id ]
+        del self.order[ node ]
+        self.dirty.discard( node )
+        self.untyped.discard( node )
+        self.held.discard( node )
+        node.release() # Only undo history may still hold the node; it need not hold its results too
+
+    def remove_node( self, node ):
+        # Remove connections associated with this node
+        connections = self._cut( [ node ] )
+        self.nodes.remove( node )
+        self._forget_node( node )
+        self._evaluation_order = None
+        self._emit( { 'op': 'remove_node', 'node': node, 'connections': connections } )
+
+    def remove_nodes( self, nodes ):
+        # Remove many nodes as one change, rewriting the node and connection lists once each
+        removed = set( nodes )
+        nodes = sorted( removed, key=self.order.__getitem__ ) # Undo re-adds them in topological order
+        connections = self._cut( nodes )
+        self.nodes[:] = [ node for node in self.nodes if node not in removed ]
+        for node in nodes:
+            self._forget_node( node )
+        self._evaluation_order = None
+        self._emit( { 'op': 'remove_nodes', 'nodes': nodes, 'connections': connections } )
+
+    def connect( self, source_node, source_socket, target_node, target_socket ):
+        # Returns the new connection, or None if it would create a cycle
+        return self.link( {
+            'source_node': source_node,
+            'source_socket': source_socket,
+            'target_node': target_node,
+            'target_socket': target_socket
+        } )
+
+    def link( self, conn ):
+        # (Re-)insert a connection dict; returns None if it would create a cycle
+        if not self._reorder_for_connection( conn[ 'source_node' ], conn[ 'target_node' ] ):
+            return None
+        self.connections.append( conn )
+        conn[ 'target_socket' ][ 'connection' ] = conn # Link locally
+        conn[ 'source_socket' ][ 'connections' ].append( conn )
+        self.version += 1
+        self.dirty.add( conn[ 'target_node' ] )
+        self.untyped.add( conn[ 'target_node' ] )
+        self.untyped.add( conn[ 'source_node' ] ) # Its consumers decide whether it can be fused
+        self._emit( { 'op': 'connect', 'connection': conn } )
+        return conn
+
+    def disconnect( self, conn ):
+        self.connections.remove( conn )
+        self._unlink( conn )
+        self._emit( { 'op': 'disconnect', 'connection': conn } )
+
+    def _unlink( self, conn ):
+        conn[ 'target_socket' ][ 'connection' ] = None
+        conn[ 'source_socket' ][ 'connections' ].remove( conn )
+        self.dirty.add( conn[ 'target_node' ] )
+        self.untyped.add( conn[ 'target_node' ] )
+        self.untyped.add( conn[ 'source_node' ] )
+        self.version += 1
+
+    def set_value( self, node, value ):
+        previous = node.value
+        node.value = value
+        self.dirty.add( node )
+        self.untyped.add( node )
+        self._emit( { 'op': 'set_value', 'node': node, 'old': previous, 'new': value } )
+
+    def set_rect( self, node, rect, previous=None ):
+        # Move/resize a node; previous is the rect before an already applied drag
+        if previous is None:
+            previous = tuple( node.rect )
+        node.rect.x, node.rect.y, node.rect.width, node.rect.height = rect
+        node._update_socket_positions()
+        self._emit( { 'op': 'set_rect', 'node': node, 'old': tuple( previous ), 'new': tuple( rect ) } )
+
+    def move_nodes( self, nodes, positions, previous=None ):
+        # Move many nodes as one change; positions are new ( x, y ) top-left corners,
+        # previous the corners before an already applied drag
+        old = []
+        for node, ( x, y ) in zip( nodes, positions ):
+            old.append( ( node.rect.x, node.rect.y ) )
+            node._translate( x - node.rect.x, y - node.rect.y )
+        Node.geometry_epoch += 1
+        if previous is not None:
+            old = [ tuple( position ) for position in previous ]
+        self._emit( { 'op': 'move_nodes', 'nodes': list( nodes ), 'old': old, 'new': [ tuple( position ) for position in positions ] } )
+
+    def drag_nodes( self, nodes, dx, dy ):
+        # Live part of a multi-node drag; like a single node's drag it is only
+        # reported once finished, through move_nodes( ..., previous= )
+        for node in nodes:
+            node._translate( dx, dy )
+        Node.geometry_epoch += 1
+
+    def add_definition( self, definition ):
+        self.definitions.append( definition )
+        # Re-assert the proxy links inside the group (they are overwritten while the nodes are outside it)
+        for conn in definition.graph.connections:
+            conn[ 'target_socket' ][ 'connection' ] = conn
+        definition.graph.untyped.update( definition.graph.nodes ) # Their inputs are bound again on the next inference
+        self._emit( { 'op': 'add_definition', 'definition': definition } )
+
+    def remove_definition( self, definition ):
+        self.definitions.remove( definition )
+        self._emit( { 'op': 'remove_definition', 'definition': definition } )
+
+    def evaluate( self ):
+        # Recompute only the dirty nodes and everything downstream of them
+        self.infer_types()
+        if not self.dirty:
+            return
+        affected = set()
+        stack = list( self.dirty )
+        self.dirty.clear()
+        while stack:
+            node = stack.pop()
+            if node in affected:
+                continue
+            affected.add( node )
+            for sock in node.output_sockets:
+                for conn in sock[ 'connections' ]:
+                    stack.append( conn[ 'target_node' ] )
+
+        if len( affected ) == len( self.nodes ):
+            order = self.evaluation_order()
+        else:
+            order = sorted( affected, key=self.order.__getitem__ )
+        runner = self.async_runner
+        held = self.held
+        for node in order:
+            if held and node in held:
+                held.discard( node ) # Runs normally from the next change on
+            elif runner is not None and isinstance( node, AsyncNode ):
+                runner.submit( node )
+            else:
+                if node.error is not None:
+                    node.error = None
+                try:
+                    if self.result_cache is None:
+                        node.compute()
+                    else:
+                        self.result_cache.compute( node )
+                except Exception as error: # Values the types allow can still fail (overflow, huge powers)
+                    node.error = "%s: %s" % ( type( error ).__name__, error )
+                    for sock in node.output_sockets:
+                        node.values[ sock[ 'name' ] ] = "Error"
+
+    def deliver( self, node, values ):
+        # Output values produced outside evaluate() (async I/O); only the consumers recompute
+        node.values.update( values )
+        for sock in node.output_sockets:
+            for conn in sock[ 'connections' ]:
+                self.dirty.add( conn[ 'target_node' ] )
+        self._emit( { 'op': 'deliver', 'node': node, 'values': values } )
+
+    def _input_types( self, node, types_of, link=None ):
+        # Type reaching each input socket, None if unconnected; link is a
+        # ( source node, source socket, target socket ) connection being tried
+        input_types = []
+        for sock in node.input_sockets:
+            if link is not None and sock is link[ 2 ]:
+                input_types.append( types_of( link[ 0 ] ).get( link[ 1 ][ 'name' ], ANY ) )
+            elif sock[ 'connection' ]:
+                conn = sock[ 'connection' ]
+                input_types.append( types_of( conn[ 'source_node' ] ).get( conn[ 'source_socket' ][ 'name' ], ANY ) )
+            else:
+                input_types.append( None )
+        return input_types
+
+    def infer_types( self ):
+        # Static pass in topological order over the nodes whose inputs changed,
+        # continuing downstream only while the inferred types keep changing
+        if not self.untyped:
+            return
+        heap = [ ( self.order[ node ], node.id, node ) for node in self.untyped ]
+        heapq.heapify( heap )
+        self.untyped.clear()
+        done = set()
+        concatenations = set()
+        types_of = operator.attrgetter( 'types' )
+        while heap:
+            node = heapq.heappop( heap )[ 2 ]
+            if node in done:
+                continue
+            done.add( node )
+            input_types = self._input_types( node, types_of )
+            try:
+                types = node.infer( input_types )
+            except TypeError as error:
+                types = { sock[ 'name' ]: ANY for sock in node.output_sockets }
+                node.type_error = str( error )
+            else:
+                node.type_error = None
+                node.specialize( input_types )
+            if isinstance( node, ConcatNode ):
+                concatenations.add( node )
+                for sock in node.input_sockets: # Whether they fuse depends on this node
+                    if sock[ 'connection' ] and isinstance( sock[ 'connection' ][ 'source_node' ], ConcatNode ):
+                        concatenations.add( sock[ 'connection' ][ 'source_node' ] )
+            if types != node.types:
+                node.types = types
+                for sock in node.output_sockets:
+                    for conn in sock[ 'connections' ]:
+                        heapq.heappush( heap, ( self.order[ conn[ 'target_node' ] ], conn[ 'target_node' ].id, conn[ 'target_node' ] ) )
+        for node in concatenations:
+            consumers = [ conn[ 'target_node' ] for sock in node.output_sockets for conn in sock[ 'connections' ] ]
+            fused = node.joinable and not node.type_error and node not in self.keep and len( consumers ) == 1 \
+                and isinstance( consumers[ 0 ], ConcatNode ) and consumers[ 0 ].joinable and not consumers[ 0 ].type_error
+            if node.fused and not fused:
+                self.dirty.add( node ) # Its own value is read again
+            node.fused = fused
+
+    def type_check( self, source_node, source_socket, target_node, target_socket ):
+        # The type error connecting the sockets would cause, or None; nothing is changed
+        self.infer_types()
+        trial = {} # Node -> output types with the connection
+        types_of = lambda node: trial.get( node, node.types )
+        link = ( source_node, source_socket, target_socket )
+        heap = [ ( self.order[ target_node ], target_node.id, target_node ) ]
+        while heap:
+            node = heapq.heappop( heap )[ 2 ]
+            if node in trial:
+                continue
+            try:
+                types = node.infer( self._input_types( node, types_of, link ) )
+            except TypeError as error:
+                if node.type_error is None:
+                    return str( error )
+                types = { sock[ 'name' ]: ANY for sock in node.output_sockets }
+            trial[ node ] = types
+            if types != node.types:
+                for sock in node.output_sockets:
+                    for conn in sock[ 'connections' ]:
+                        heapq.heappush( heap, ( self.order[ conn[ 'target_node' ] ], conn[ 'target_node' ].id, conn[ 'target_node' ] ) )
+        return None
+
+    def evaluation_order( self ):
+        if self._evaluation_order is None:
+            self._evaluation_order = sorted( self.nodes, key=self.order.__getitem__ )
+        return self._evaluation_order
+
+    def extract( self, selection ):
+        # Move the given nodes and the connections among them into a new Graph.
+        # Connections crossing the selection boundary must be disconnected first.
+        selected = set( selection )
+        nodes = [ node for node in self.evaluation_order() if node in selected ]
+        connections = [ conn for conn in self.connections if conn[ 'source_node' ] in selected ]
+        inner = Graph( nodes ) # Ascending order keeps the inner order topological
+        inner.connections.extend( connections )
+        self.detach( nodes, connections )
+        return inner
+
+    def detach( self, nodes, connections ):
+        # Drop nodes and the connections among them without unlinking their sockets
+        detached = set( nodes )
+        doomed = set( id( conn ) for conn in connections )
+        self.connections[:] = [ conn for conn in self.connections if id( conn ) not in doomed ]
+        self.nodes[:] = [ node for node in self.nodes if node not in detached ]
+        for node in nodes:
+            del self.order[ node ]
+            del self.by_id[ node.id ]
+            self.dirty.discard( node )
+            self.untyped.discard( node )
+        self._evaluation_order = None
+        self.version += 1
+        self._emit( { 'op': 'detach', 'nodes': nodes, 'connections': connections } )
+
+    def absorb( self, nodes, connections ):
+        # Inverse of detach; nodes must be given in topological order
+        absorbed = set( nodes )
+        for node in nodes:
+            # Links from outside were cut before detaching, so any left over belong to a group proxy
+            for sock in node.input_sockets:
+                if sock[ 'connection' ] and sock[ 'connection' ][ 'source_node' ] not in absorbed:
+                    sock[ 'connection' ] = None
+            self.nodes.append( node )
+            self.by_id[ node.id ] = node
+            self.order[ node ] = self.next_order
+            self.next_order += 1
+            self.dirty.add( node )
+            self.untyped.add( node )
+        self.connections.extend( connections )
+        self._evaluation_order = None
+        self.version += 1
+        self._emit( { 'op': 'absorb', 'nodes': nodes, 'connections': connections } )
+
+    def _reorder_for_connection( self, source, target ):
+        if source is target:
+            return False
+        lower = self.order[ target ]
+        upper = self.order[ source ]
+        if upper < lower:
+            return True # Already consistent with the current order
+
+        # Nodes reachable from the target that are ordered before the source
+        forward = []
+        stack = [ target ]
+        visited = { target }
+        while stack:
+            node = stack.pop()
+            forward.append( node )
+            for sock in node.output_sockets:
+                for conn in sock[ 'connections' ]:
+                    child = conn[ 'target_node' ]
+                    if child is source:
+                        return False # The new connection would close a cycle
+                    if child not in visited and self.order[ child ] < upper:
+                        visited.add( child )
+                        stack.append( child )
+
+        # Nodes reaching the source that are ordered after the target
+        backward = []
+        stack = [ source ]
+        visited = { source }
+        while stack:
+            node = stack.pop()
+            backward.append( node )
+            for sock in node.input_sockets:
+                if sock[ 'connection' ]:
+                    parent = sock[ 'connection' ][ 'source_node' ]
+                    if parent not in visited and self.order[ parent ] > lower:
+                        visited.add( parent )
+                        stack.append( parent )
+
+        # Reuse the affected positions: everything reaching the source goes before everything the target reaches
+        backward.sort( key=self.order.__getitem__ )
+        forward.sort( key=self.order.__getitem__ )
+        slots = sorted( self.order[ node ] for node in backward + forward )
+        for node, slot in zip( backward + forward, slots ):
+            self.order[ node ] = slot
+        self._evaluation_order = None
+        return True
+
+def collapse_to_group( graph, selection, name ):
+    # Replace the selected nodes with a single GroupNode wrapping them.
+    # Returns the new GroupNode, or None if the selection cannot be grouped.
+    selected = set( selection )
+    if not selected or any( isinstance( node, AsyncNode ) for node in selected ):
+        return None # Group plans compute inline, which would block on I/O
+
+    incoming = [] # Outside -> selection
+    outgoing = [] # Selection -> outside
+    for node in sorted( selected, key=graph.order.__getitem__ ):
+        for sock in node.input_sockets:
+            if sock[ 'connection' ] and sock[ 'connection' ][ 'source_node' ] not in selected:
+                incoming.append( sock[ 'connection' ] )
+        for sock in node.output_sockets:
+            for conn in sock[ 'connections' ]:
+                if conn[ 'target_node' ] not in selected:
+                    outgoing.append( conn )
+
+    # A path leaving the selection and re-entering it would make the group feed itself.
+    # Only nodes ordered before the last selected node can lead back into the selection.
+    last = max( graph.order[ node ] for node in selected )
+    stack = [ conn[ 'target_node' ] for conn in outgoing ]
+    visited = set()
+    while stack:
+        node = stack.pop()
+        if node in visited or graph.order[ node ] > last:
+            continue
+        visited.add( node )
+        for sock in node.output_sockets:
+            for conn in sock[ 'connections' ]:
+                if conn[ 'target_node' ] in selected:
+                    return None
+                stack.append( conn[ 'target_node' ] )
+
+    for conn in incoming + outgoing:
+        graph.disconnect( conn )
+    inner = graph.extract( selected )
+    for node in selected:
+        node.selected = False
+
+    # One group input per selected socket fed from outside
+    inputs = []
+    taken = set()
+    for conn in incoming:
+        target_node = conn[ 'target_node' ]
+        proxy = GroupInputNode( target_node.rect.x - 120, target_node.rect.y, _unique_name( conn[ 'target_socket' ][ 'name' ], taken ) )
+        inner.add_node( proxy )
+        inputs.append( proxy )
+
+    # One group output per selected output socket read from outside
+    outputs = []
+    output_for_socket = {}
+    for conn in outgoing:
+        key = id( conn[ 'source_socket' ] )
+        if key not in output_for_socket:
+            output_for_socket[ key ] = len( outputs )
+            outputs.append( ( conn[ 'source_node' ], conn[ 'source_socket' ][ 'name' ] ) )
+
+    for proxy, conn in zip( inputs, incoming ):
+        inner.connect( proxy, proxy.output_sockets[ 0 ], conn[ 'target_node' ], conn[ 'target_socket' ] )
+    definition = GroupDefinition( name, inner, inputs, outputs )
+    definition.compile()
+    graph.add_definition( definition )
+
+    left = min( node.rect.left for node in selected )
+    top = min( node.rect.top for node in selected )
+    group = graph.add_node( GroupNode( left, top, definition ) )
+    for group_socket, conn in zip( group.input_sockets, incoming ):
+        graph.connect( conn[ 'source_node' ], conn[ 'source_socket' ], group, group_socket )
+    for conn in outgoing:
+        group_socket = group.output_sockets[ output_for_socket[ id( conn[ 'source_socket' ] ) ] ]
+        graph.connect( group, group_socket, conn[ 'target_node' ], conn[ 'target_socket' ] )
+    return group
+
+# --- Selection ---
+class Selection:
+    # --- The set of selected nodes ---
+    # Bulk operations work from this set, so they cost O(k) in the selection size
+    # instead of scanning every node for its flag. node.selected mirrors membership
+    # for drawing, and nodes leave the set as soon as the graph drops them.
+    def __init__( self, graph ):
+        self.nodes = set()
+        graph.listeners.append( self.record )
+
+    def record( self, change ):
+        if change[ 'op' ] == 'remove_node':
+            self.discard( change[ 'node' ] )
+        elif change[ 'op' ] in ( 'remove_nodes', 'detach' ):
+            for node in change[ 'nodes' ]:
+                self.discard( node )
+
+    def __len__( self ):
+        return len( self.nodes )
+
+    def __contains__( self, node ):
+        return node in self.nodes
+
+    def __iter__( self ):
+        return iter( list( self.nodes ) )
+
+    def add( self, node ):
+        self.nodes.add( node )
+        node.selected = True
+
+    def discard( self, node ):
+        self.nodes.discard( node )
+        node.selected = False
+
+    def toggle( self, node ):
+        if node in self.nodes:
+            self.discard( node )
+        else:
+            self.add( node )
+
+    def replace( self, nodes ):
+        for node in self.nodes:
+            node.selected = False
+        self.nodes = set()
+        for node in nodes:
+            self.add( node )
+
+def duplicate_nodes( graph, nodes, offset=( 20, 20 ) ):
+    # Copy the nodes and the connections among them, one pass over their input sockets.
+    # Returns the copies; connections from outside the selection are not copied.
+    definitions = { definition.name: definition for definition in graph.definitions }
+    types = _node_types()
+    copies = {}
+    for node in sorted( nodes, key=graph.order.__getitem__ ): # Topological, so no connection below reorders
+        record = node_to_dict( node )
+        record[ 'id' ] = Node.next_id
+        record[ 'rect' ][ 0 ] += offset[ 0 ]
+        record[ 'rect' ][ 1 ] += offset[ 1 ]
+        copies[ node ] = graph.add_node( node_from_dict( record, definitions, types ) )
+    for node, copy in copies.items():
+        for target_socket, sock in zip( copy.input_sockets, node.input_sockets ):
+            conn = sock[ 'connection' ]
+            if conn and conn[ 'source_node' ] in copies:
+                source = copies[ conn[ 'source_node' ] ]
+                index = _socket_index( conn[ 'source_node' ].output_sockets, conn[ 'source_socket' ] )
+                graph.connect( source, source.output_sockets[ index ], copy, target_socket )
+    return list( copies.values() )
+
+# --- Auto Layout ---
+# Layered left-to-right layout. Every node goes one column right of its furthest
+# upstream node (sources sit just left of their first consumer), then a few
+# barycenter sweeps reorder each column by the mean position of the connected
+# nodes in the columns already placed, which removes most edge crossings. Each
+# sweep is linear in nodes and connections plus one sort per column.
+LAYOUT_COLUMN_GAP = 80
+LAYOUT_ROW_GAP = 20
+LAYOUT_SWEEPS = 4
+
+def layout_graph( graph ):
+    nodes = graph.evaluation_order()
+    if not nodes:
+        return
+    parents = {}
+    children = {}
+    layer = {}
+    for node in nodes: # Topological order, so every parent already has its layer
+        parents[ node ] = [ sock[ 'connection' ][ 'source_node' ] for sock in node.input_sockets if sock[ 'connection' ] ]
+        children[ node ] = [ conn[ 'target_node' ] for sock in node.output_sockets for conn in sock[ 'connections' ] ]
+        layer[ node ] = max( layer[ parent ] for parent in parents[ node ] ) + 1 if parents[ node ] else 0
+    for node in nodes:
+        if not parents[ node ] and children[ node ]:
+            layer[ node ] = min( layer[ child ] for child in children[ node ] ) - 1
+
+    columns = {}
+    for node in sorted( nodes, key=lambda node: node.rect.y ): # Start from the current vertical order
+        columns.setdefault( layer[ node ], [] ).append( node )
+    columns = [ columns[ index ] for index in sorted( columns ) ]
+    position = {}
+    for column in columns:
+        for index, node in enumerate( column ):
+            position[ node ] = index
+
+    for sweep in range( LAYOUT_SWEEPS ):
+        downstream = sweep % 2 == 0
+        neighbours = parents if downstream else children
+        for column in ( columns[ 1: ] if downstream else columns[ -2::-1 ] ):
+            barycenter = {}
+            for node in column:
+                linked = neighbours[ node ]
+                barycenter[ node ] = sum( position[ other ] for other in linked ) / len( linked ) if linked else position[ node ]
+            column.sort( key=barycenter.__getitem__ )
+            for index, node in enumerate( column ):
+                position[ node ] = index
+
+    # Columns are centered on the tallest one, starting at the graph's current top-left corner
+    left = min( node.rect.x for node in nodes )
+    top = min( node.rect.y for node in nodes )
+    heights = [ sum( node.rect.height + LAYOUT_ROW_GAP for node in column ) for column in columns ]
+    tallest = max( heights )
+    moved = []
+    positions = []
+    x = left
+    for column, height in zip( columns, heights ):
+        y = top + ( tallest - height ) // 2
+        for node in column:
+            moved.append( node )
+            positions.append( ( x, y ) )
+            y += node.rect.height + LAYOUT_ROW_GAP
+        x += max( node.rect.width for node in column ) + LAYOUT_COLUMN_GAP
+    graph.move_nodes( moved, positions )
+
+# --- Connection Rendering ---
+CURVED_CONNECTIONS = False # Draw connections as Bezier curves instead of straight lines
+CURVE_SEGMENTS = 16
+LIVE_FRAMES = 30 # Frames a moved connection stays off the cached layer
+BULK_MOVE_NODES = 64 # More nodes (and over half the graph) moving in one frame is a bulk move, drawn straight onto the layer
+
+def connection_points( start, end ):
+    if not CURVED_CONNECTIONS:
+        return [ start, end ]
+    # Cubic Bezier leaving the output and entering the input horizontally
+    handle = max( 30, abs( end[ 0 ] - start[ 0 ] ) / 2 )
+    x0, y0 = start
+    x3, y3 = end
+    x1, x2 = x0 + handle, x3 - handle
+    points = []
+    for i in range( CURVE_SEGMENTS + 1 ):
+        t = i / CURVE_SEGMENTS
+        u = 1 - t
+        a, b, c, d = u * u * u, 3 * u * u * t, 3 * u * t * t, t * t * t
+        points.append( ( a * x0 + b * x1 + c * x2 + d * x3, a * y0 + b * y0 + c * y3 + d * y3 ) )
+    return points
+
+def _draw_connection( surface, points ):
+    if len( points ) == 2:
+        pygame.draw.line( surface, CONNECTION_COLOR, points[ 0 ], points[ 1 ], 2 )
+        pygame.draw.aaline( surface, WHITE, points[ 0 ], points[ 1 ] )
+    else:
+        pygame.draw.lines( surface, CONNECTION_COLOR, False, points, 2 )
+        pygame.draw.aalines( surface, WHITE, False, points )
+
+class ConnectionRenderer:
+    # --- Draws the background and all connections ---
+    # Each connection caches its polyline until its source or target node moves
+    # (see Node._update_socket_positions). Connections that have not moved for a
+    # while are pre-rendered onto a background layer, so a frame costs one blit
+    # plus the few connections attached to nodes that are being dragged. Polylines
+    # are kept in screen coordinates, so moving the view redraws everything.
+    def __init__( self, size ):
+        self.layer = pygame.Surface( size ).convert()
+        self.layer.fill( GREY )
+        self.layer_conns = {} # Connections currently drawn on the layer, by id
+        self.graph_version = None
+        self.geometry_epoch = None
+        self.node_versions = weakref.WeakKeyDictionary() # Node -> geometry_version last seen
+        self.live = [] # Recently moved connections, drawn every frame
+        self.layer_live = None # Ids of the connections left off the layer
+        self.frame = 0
+        self.offset = ( 0, 0 ) # View offset the polylines were computed for
+
+    def _update_geometry( self, conn ):
+        conn[ 'geometry_key' ] = ( conn[ 'source_node' ].geometry_version, conn[ 'target_node' ].geometry_version )
+        dx, dy = self.offset
+        source = conn[ 'source_socket' ][ 'pos' ]
+        target = conn[ 'target_socket' ][ 'pos' ]
+        conn[ 'geometry' ] = points = connection_points( ( source[ 0 ] + dx, source[ 1 ] + dy ), ( target[ 0 ] + dx, target[ 1 ] + dy ) )
+        xs = [ point[ 0 ] for point in points ]
+        ys = [ point[ 1 ] for point in points ]
+        conn[ 'bbox' ] = pygame.Rect( min( xs ) - 2, min( ys ) - 2, max( xs ) - min( xs ) + 5, max( ys ) - min( ys ) + 5 )
+
+    def _redraw_layer( self, static ):
+        # Repaint only the area where connections left or joined the layer
+        regions = [ conn[ 'layer_bbox' ] for key, conn in self.layer_conns.items() if key not in static ]
+        for key, conn in static.items():
+            if key not in self.layer_conns:
+                conn[ 'layer_bbox' ] = conn[ 'bbox' ]
+                regions.append( conn[ 'bbox' ] )
+        self.layer_conns = static
+        if not regions:
+            return
+        region = regions[ 0 ].unionall( regions[ 1: ] )
+        self.layer.set_clip( region )
+        self.layer.fill( GREY )
+        for conn in static.values():
+            if region.colliderect( conn[ 'layer_bbox' ] ):
+                _draw_connection( self.layer, conn[ 'geometry' ] )
+        self.layer.set_clip( None )
+
+    def draw( self, surface, graph, offset=( 0, 0 ) ):
+        self.frame += 1
+
+        # Only the connections of nodes that moved since the last frame are recomputed
+        view_moved = offset != self.offset
+        if view_moved or Node.geometry_epoch != self.geometry_epoch:
+            self.geometry_epoch = Node.geometry_epoch
+            self.offset = offset
+            moved = []
+            for node in graph.nodes:
+                seen = self.node_versions.get( node )
+                if seen == node.geometry_version:
+                    continue
+                self.node_versions[ node ] = node.geometry_version
+                if seen is not None: # New nodes' connections are picked up below
+                    moved.append( node )
+            if view_moved or len( moved ) > max( BULK_MOVE_NODES, len( graph.nodes ) // 2 ):
+                # A new view, or a layout rather than a drag: nothing will keep moving, so repaint the layer from scratch
+                for conn in graph.connections:
+                    self._update_geometry( conn )
+                self.layer.fill( GREY )
+                self.layer_conns = {}
+                self.layer_live = None
+                moved = []
+            for node in moved:
+                for sock in node.input_sockets:
+                    if sock[ 'connection' ]:
+                        self._update_geometry( sock[ 'connection' ] )
+                        sock[ 'connection' ][ 'moved_frame' ] = self.frame
+                        self.live.append( sock[ 'connection' ] )
+                for sock in node.output_sockets:
+                    for conn in sock[ 'connections' ]:
+                        self._update_geometry( conn )
+                        conn[ 'moved_frame' ] = self.frame
+                        self.live.append( conn )
+
+        # New (or re-linked) connections go straight onto the layer
+        structure_changed = graph.version != self.graph_version
+        if structure_changed:
+            self.graph_version = graph.version
+            for conn in graph.connections:
+                if conn.get( 'geometry_key' ) != ( conn[ 'source_node' ].geometry_version, conn[ 'target_node' ].geometry_version ):
+                    self._update_geometry( conn )
+
+        # Connections that stopped moving (or were removed) go back onto the layer
+        live = {}
+        for conn in self.live:
+            if self.frame - conn[ 'moved_frame' ] < LIVE_FRAMES:
+                live[ id( conn ) ] = conn
+        if structure_changed:
+            current = set( id( conn ) for conn in graph.connections )
+            live = { key: conn for key, conn in live.items() if key in current }
+        self.live = list( live.values() )
+
+        if structure_changed or self.layer_live is None or set( live ) != self.layer_live:
+            self.layer_live = set( live )
+            self._redraw_layer( { id( conn ): conn for conn in graph.connections if id( conn ) not in live } )
+
+        surface.blit( self.layer, ( 0, 0 ) )
+        for conn in self.live:
+            _draw_connection( surface, conn[ 'geometry' ] )
+
+# --- Minimap ---
+MINIMAP_SIZE = ( 200, 140 )
+MINIMAP_COLOR = ( 40, 40, 50 )
+MINIMAP_SLACK = 0.25 # Extra room around the graph, so small moves do not rescale the map
+
+class Minimap:
+    # --- Downscaled overview of every node and connection, in a screen corner ---
+    # The map is kept on a cached surface along with the mapped rect of every
+    # node and connection. Only changed nodes are mapped again: a node being
+    # dragged repaints just the part of the map it covered before and covers now,
+    # while edits and the end of a drag repaint the map from the cached rects.
+    # Everything is re-mapped only when something (or the view) leaves the mapped
+    # area or most of the graph moved at once. A frame without changes costs one blit.
+    def __init__( self, screen_size, graph, size=MINIMAP_SIZE ):
+        self.screen_size = screen_size
+        self.rect = pygame.Rect( screen_size[ 0 ] - size[ 0 ] - 10, screen_size[ 1 ] - size[ 1 ] - 10, size[ 0 ], size[ 1 ] )
+        self.surface = pygame.Surface( size ).convert()
+        self.bounds = None # Area of the canvas shown on the map
+        self.scale = 1.0
+        self.node_rects = {} # Node -> rect drawn on the map
+        self.conn_lines = {} # Connection id -> ( connection, end points, rect ) drawn on the map
+        self.node_versions = weakref.WeakKeyDictionary() # Node -> geometry_version last drawn
+        self.geometry_epoch = None
+        self.structure_changed = True
+        self.drag_finished = False
+        self.offset = ( 0, 0 ) # View offset drawn as the view frame
+        self.graph = graph
+        graph.listeners.append( self.record )
+
+    def record( self, change ):
+        # Moves are found through geometry versions, which also covers drags in progress
+        if change[ 'op' ] in ( 'set_rect', 'move_nodes' ):
+            self.drag_finished = True
+        elif change[ 'op' ] not in ( 'set_value', 'deliver' ):
+            self.structure_changed = True
+
+    def _map_point( self, point ):
+        return ( int( ( point[ 0 ] - self.bounds.x ) * self.scale ), int( ( point[ 1 ] - self.bounds.y ) * self.scale ) )
+
+    def _map_rect( self, rect ):
+        x, y = self._map_point( ( rect[ 0 ], rect[ 1 ] ) )
+        return pygame.Rect( x, y, max( 2, int( rect[ 2 ] * self.scale ) ), max( 2, int( rect[ 3 ] * self.scale ) ) )
+
+    def _map_connection( self, conn ):
+        start = self._map_point( conn[ 'source_socket' ][ 'pos' ] )
+        end = self._map_point( conn[ 'target_socket' ][ 'pos' ] )
+        line_rect = pygame.Rect( min( start[ 0 ], end[ 0 ] ), min( start[ 1 ], end[ 1 ] ), abs( end[ 0 ] - start[ 0 ] ) + 1, abs( end[ 1 ] - start[ 1 ] ) + 1 )
+        self.conn_lines[ id( conn ) ] = ( conn, ( start, end ), line_rect )
+        return line_rect
+
+    def _canvas_view( self ):
+        # Part of the canvas on screen
+        return pygame.Rect( ( -self.offset[ 0 ], -self.offset[ 1 ] ), self.screen_size )
+
+    def _view_rect( self ):
+        return self._map_rect( self._canvas_view() )
+
+    def _rebuild( self, graph ):
+        # Fit the whole graph plus the visible screen area, with some slack
+        content = self._canvas_view().unionall( [ node.rect for node in graph.nodes ] )
+        self.scale = min( self.rect.width / ( content.width * ( 1 + MINIMAP_SLACK ) ), self.rect.height / ( content.height * ( 1 + MINIMAP_SLACK ) ) )
+        # The mapped area has the map's aspect ratio, centered on the content
+        self.bounds = pygame.Rect( 0, 0, int( self.rect.width / self.scale ), int( self.rect.height / self.scale ) )
+        self.bounds.center = content.center
+        self.node_rects = { node: self._map_rect( node.rect ) for node in graph.nodes }
+        self.conn_lines = {}
+        for conn in graph.connections:
+            self._map_connection( conn )
+        for node in graph.nodes:
+            self.node_versions[ node ] = node.geometry_version
+        self._repaint( self.surface.get_rect() )
+
+    def _repaint( self, region ):
+        self.surface.set_clip( region )
+        self.surface.fill( MINIMAP_COLOR )
+        for conn, ( start, end ), line_rect in self.conn_lines.values():
+            if region.colliderect( line_rect ):
+                pygame.draw.line( self.surface, CONNECTION_COLOR, start, end )
+        for node, node_rect in self.node_rects.items():
+            if region.colliderect( node_rect ):
+                pygame.draw.rect( self.surface, node.body_color, node_rect )
+        pygame.draw.rect( self.surface, WHITE, self._view_rect(), 1 )
+        pygame.draw.rect( self.surface, NODE_BORDER_COLOR, self.surface.get_rect(), 1 )
+        self.surface.set_clip( None )
+
+    def _update( self, graph ):
+        structure_changed = self.structure_changed
+        if not structure_changed and Node.geometry_epoch == self.geometry_epoch:
+            return
+        self.structure_changed = False
+        self.geometry_epoch = Node.geometry_epoch
+        moved = [ node for node in graph.nodes if self.node_versions.get( node ) != node.geometry_version ] # Includes new nodes
+        if not moved and not structure_changed:
+            return
+        if self.bounds is None or len( moved ) > len( graph.nodes ) // 2 \
+                or not all( self.bounds.contains( node.rect ) for node in moved ):
+            self._rebuild( graph )
+            return
+
+        # Only changed nodes and connections are mapped again. While nodes are
+        # dragged, only where they were drawn and are drawn now is repainted
+        regions = []
+        if structure_changed:
+            current = set( graph.nodes )
+            for node in [ node for node in self.node_rects if node not in current ]:
+                del self.node_rects[ node ]
+        for node in moved:
+            if node in self.node_rects:
+                regions.append( self.node_rects[ node ] )
+            self.node_rects[ node ] = self._map_rect( node.rect )
+            regions.append( self.node_rects[ node ] )
+            self.node_versions[ node ] = node.geometry_version
+        if structure_changed:
+            self.conn_lines = {}
+            for conn in graph.connections:
+                self._map_connection( conn )
+            self._repaint( self.surface.get_rect() )
+            return
+        for node in moved:
+            attached = [ sock[ 'connection' ] for sock in node.input_sockets if sock[ 'connection' ] ]
+            for sock in node.output_sockets:
+                attached.extend( sock[ 'connections' ] )
+            for conn in attached:
+                regions.append( self.conn_lines[ id( conn ) ][ 2 ] )
+                regions.append( self._map_connection( conn ) )
+        if regions:
+            self._repaint( regions[ 0 ].unionall( regions[ 1: ] ).inflate( 2, 2 ) )
+
+    def draw( self, surface, offset=( 0, 0 ) ):
+        if offset != self.offset:
+            self.offset = offset
+            if self.bounds is not None and self.bounds.contains( self._canvas_view() ):
+                self._repaint( self.surface.get_rect() ) # Only the view frame moved
+            else:
+                self._rebuild( self.graph )
+        self._update( self.graph )
+        if self.drag_finished:
+            # Lines clipped to a repaint region can miss a pixel at its edge, so clean up once per drag
+            self.drag_finished = False
+            self._repaint( self.surface.get_rect() )
+        surface.blit( self.surface, self.rect )
+
+    def handle_event( self, event ):
+        # Clicking the map centers the view on that point: returns the new view
+        # offset, or None if the event is not for the map. The graph is untouched,
+        # so navigating is neither an undo step nor an autosave record.
+        if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and self.rect.collidepoint( event.pos ):
+            if self.bounds is None:
+                return self.offset
+            x = self.bounds.x + ( event.pos[ 0 ] - self.rect.x ) / self.scale
+            y = self.bounds.y + ( event.pos[ 1 ] - self.rect.y ) / self.scale
+            return ( int( self.screen_size[ 0 ] / 2 - x ), int( self.screen_size[ 1 ] / 2 - y ) )
+        return None
+
+# --- Undo / Redo ---
+class History:
+    # --- Command log of graph changes ---
+    # Each step stores only the changes the graph reported (the affected nodes,
+    # connections and old/new values), never a copy of the graph. Undo and redo
+    # apply the inverse changes directly, so only the touched nodes are recomputed.
+    MAX_STEPS = 500
+    MAX_BYTES = 256 * 1024 * 1024 # Values the steps may keep alive (old values, removed nodes)
+
+    def __init__( self, graph ):
+        self.graph = graph
+        self.undo_stack = []
+        self.redo_stack = []
+        self.step_bytes = {} # id( step ) -> bytes of values only that step keeps alive
+        self.retained = 0
+        self.pending = None # Changes of an open transaction
+        self.applying = False
+        graph.listeners.append( self.record )
+
+    def record( self, change ):
+        if self.applying or change[ 'op' ] == 'deliver': # Results, not edits
+            return
+        if self.pending is not None:
+            self.pending.append( change )
+            return
+        self._push( [ change ] )
+
+    @contextlib.contextmanager
+    def transaction( self ):
+        # Record every change made inside the block as a single undo step
+        self.pending = []
+        try:
+            yield
+        finally:
+            changes, self.pending = self.pending, None
+            if changes:
+                self._push( changes )
+
+    def _push( self, changes ):
+        self.undo_stack.append( changes )
+        size = sum( _change_size( change ) for change in changes )
+        self.step_bytes[ id( changes ) ] = size
+        self.retained += size
+        for step in self.redo_stack:
+            self._forget( step )
+        self.redo_stack.clear()
+        # The oldest steps go first once there are too many, or they hold too much memory
+        while len( self.undo_stack ) > self.MAX_STEPS or ( self.retained > self.MAX_BYTES and len( self.undo_stack ) > 1 ):
+            self._forget( self.undo_stack.pop( 0 ) )
+
+    def _forget( self, changes ):
+        self.retained -= self.step_bytes.pop( id( changes ) )
+
+    def nodes( self ):
+        # Nodes referenced by any step (removed nodes stay alive here until their step is dropped)
+        held = set()
+        for changes in self.undo_stack + self.redo_stack:
+            for change in changes:
+                if 'node' in change:
+                    held.add( change[ 'node' ] )
+                held.update( change.get( 'nodes', () ) )
+                if 'definition' in change and not isinstance( change[ 'definition' ], str ):
+                    held.update( change[ 'definition' ].graph.nodes )
+        return held
+
+    def undo( self ):
+        if not self.undo_stack:
+            return False
+        changes = self.undo_stack.pop()
+        self.applying = True
+        try:
+            for change in reversed( changes ):
+                self._revert( change )
+        finally:
+            self.applying = False
+        self.redo_stack.append( changes )
+        return True
+
+    def redo( self ):
+        if not self.redo_stack:
+            return False
+        changes = self.redo_stack.pop()
+        self.applying = True
+        try:
+            for change in changes:
+                self._apply( change )
+        finally:
+            self.applying = False
+        self.undo_stack.append( changes )
+        return True
+
+    def _apply( self, change ):
+        graph = self.graph
+        op = change[ 'op' ]
+        if op == 'add_node':
+            graph.add_node( change[ 'node' ] )
+        elif op == 'remove_node':
+            graph.remove_node( change[ 'node' ] )
+        elif op == 'remove_nodes':
+            graph.remove_nodes( change[ 'nodes' ] )
+        elif op == 'connect':
+            graph.link( change[ 'connection' ] )
+        elif op == 'disconnect':
+            graph.disconnect( change[ 'connection' ] )
+        elif op == 'set_value':
+            graph.set_value( change[ 'node' ], change[ 'new' ] )
+        elif op == 'set_rect':
+            graph.set_rect( change[ 'node' ], change[ 'new' ] )
+        elif op == 'move_nodes':
+            graph.move_nodes( change[ 'nodes' ], change[ 'new' ] )
+        elif op == 'add_definition':
+            graph.add_definition( change[ 'definition' ] )
+        elif op == 'remove_definition':
+            graph.remove_definition( change[ 'definition' ] )
+        elif op == 'detach':
+            graph.detach( change[ 'nodes' ], change[ 'connections' ] )
+        elif op == 'absorb':
+            graph.absorb( change[ 'nodes' ], change[ 'connections' ] )
+
+    def _revert( self, change ):
+        graph = self.graph
+        op = change[ 'op' ]
+        if op == 'add_node':
+            graph.remove_node( change[ 'node' ] )
+        elif op == 'remove_node':
+            graph.add_node( change[ 'node' ] )
+            for conn in change[ 'connections' ]:
+                graph.link( conn )
+        elif op == 'remove_nodes':
+            for node in change[ 'nodes' ]:
+                graph.add_node( node )
+            for conn in change[ 'connections' ]:
+                graph.link( conn )
+        elif op == 'connect':
+            graph.disconnect( change[ 'connection' ] )
+        elif op == 'disconnect':
+            graph.link( change[ 'connection' ] )
+        elif op == 'set_value':
+            graph.set_value( change[ 'node' ], change[ 'old' ] )
+        elif op == 'set_rect':
+            graph.set_rect( change[ 'node' ], change[ 'old' ] )
+        elif op == 'move_nodes':
+            graph.move_nodes( change[ 'nodes' ], change[ 'old' ] )
+        elif op == 'add_definition':
+            graph.remove_definition( change[ 'definition' ] )
+        elif op == 'remove_definition':
+            graph.add_definition( change[ 'definition' ] )
+        elif op == 'detach':
+            graph.absorb( change[ 'nodes' ], change[ 'connections' ] )
+        elif op == 'absorb':
+            graph.detach( change[ 'nodes' ], change[ 'connections' ] )
+
+# --- Memory Accounting ---
+# Approximate sizes of what the graph and the undo history keep alive, for the
+# memory report (Ctrl+I) and the history's byte budget.
+def retained_size( value ):
+    # Bytes kept alive by a value; buffers, big ints and long strings dominate
+    if _is_array( value ):
+        return value.nbytes
+    if isinstance( value, ( list, tuple ) ):
+        return sys.getsizeof( value ) + sum( sys.getsizeof( item ) for item in value )
+    return sys.getsizeof( value )
+
+def node_retained_size( node ):
+    size = sum( retained_size( value ) for value in node.values.values() )
+    if hasattr( node, "value" ):
+        size += retained_size( node.value )
+    if hasattr( node, "display_value" ):
+        size += retained_size( node.display_value )
+    if node.preview_surf is not None:
+        size += node.preview_surf.get_bytesize() * node.preview_surf.get_width() * node.preview_surf.get_height()
+    return size
+
+def _change_size( change ):
+    op = change[ 'op' ]
+    if op == 'set_value':
+        return retained_size( change[ 'old' ] ) + retained_size( change[ 'new' ] )
+    if op == 'remove_node':
+        return node_retained_size( change[ 'node' ] ) # Results were released, so this is mostly its constant
+    if op == 'remove_nodes':
+        return sum( node_retained_size( node ) for node in change[ 'nodes' ] )
+    return 0
+
+def memory_report( graph, history=None, top=10 ):
+    gc.collect() # Deleted connections form cycles with nothing else; count them as freed
+    sizes = sorted( ( ( node_retained_size( node ), node ) for node in graph.nodes ), key=lambda item: item[ 0 ], reverse=True )
+    accounted = set( graph.nodes )
+    for definition in graph.definitions:
+        accounted.update( definition.graph.nodes )
+    report = {
+        'nodes': len( graph.nodes ),
+        'connections': len( graph.connections ),
+        'definitions': len( graph.definitions ),
+        'node_types': dict( collections.Counter( type( node ).__name__ for node in graph.nodes ) ),
+        'graph_bytes': sum( size for size, node in sizes ),
+        'largest_nodes': [ [ node.id, node.title, size ] for size, node in sizes[ :top ] ],
+        'live_node_objects': len( Node.live )
+    }
+    if history is not None:
+        held = history.nodes() - accounted
+        accounted.update( held )
+        report[ 'history' ] = { 'steps': len( history.undo_stack ) + len( history.redo_stack ), 'bytes': history.retained, 'removed_nodes': len( held ) }
+    # Node objects that are neither in the graph, a group, nor the history: should stay at 0
+    report[ 'unaccounted_node_objects' ] = len( Node.live ) - len( accounted )
+    return report
+
+# --- Serialization ---
+# Graphs are stored as plain dicts/lists (JSON compatible). Nodes are referenced
+# by their stable id and sockets by their index on the node.
+VALUE_NODE_TYPES = ( 'IntegerNode', 'RndIntegerNode', 'FloatNode', 'RndFloatNode', 'StringNode', 'ArrayNode' )
+
+def _node_types():
+    types = {}
+    stack = [ Node ]
+    while stack:
+        cls = stack.pop()
+        types[ cls.__name__ ] = cls
+        stack.extend( cls.__subclasses__() )
+    return types
+
+def headless_node_types( allow_io=False ):
+    # Node types accepted in graphs from outside the editor (server requests,
+    # --graph files). The I/O nodes read and write files and run programs, so
+    # they are only available when explicitly allowed.
+    return { name: cls for name, cls in _node_types().items()
+             if cls not in ( Node, OperatorNode, AsyncNode ) and ( allow_io or not issubclass( cls, AsyncNode ) ) }
+
+def _socket_index( sockets, sock ):
+    for index, candidate in enumerate( sockets ):
+        if candidate is sock:
+            return index
+    raise ValueError( "Socket does not belong to node" )
+
+def _to_json_value( value ):
+    if hasattr( value, "tolist" ): # array.array and NumPy arrays
+        value = value.tolist()
+    if isinstance( value, ( list, tuple ) ):
+        return [ _to_json_value( item ) for item in value ]
+    return value
+
+def node_to_dict( node ):
+    record = { 'id': node.id, 'type': type( node ).__name__, 'rect': list( node.rect ) }
+    if type( node ).__name__ in VALUE_NODE_TYPES:
+        record[ 'value' ] = _to_json_value( node.value )
+    elif isinstance( node, GroupNode ):
+        record[ 'definition' ] = node.definition.name
+    elif isinstance( node, GroupInputNode ):
+        record[ 'name' ] = node.title
+    return record
+
+def node_from_dict( record, definitions, types=None ):
+    cls = ( types or _node_types() ).get( record[ 'type' ] )
+    if cls is None:
+        raise ValueError( "Unknown node type %r" % record[ 'type' ] )
+    x, y, width, height = record[ 'rect' ]
+    if cls is GroupNode:
+        node = cls( x, y, definitions[ record[ 'definition' ] ] )
+    elif cls is GroupInputNode:
+        node = cls( x, y, record[ 'name' ] )
+    else:
+        node = cls( x, y )
+    if 'value' in record:
+        if cls is ArrayNode:
+            node.value = array_from_list( record[ 'value' ] )
+            node.input_text = array_text( node.value )
+        else:
+            node.value = record[ 'value' ]
+            node.input_text = str( node.value )
+    node.rect.width = width
+    node.rect.height = height
+    node._update_socket_positions()
+    node.id = record[ 'id' ]
+    Node.next_id = max( Node.next_id, node.id + 1 )
+    return node
+
+def connection_to_dict( conn ):
+    return {
+        'source': conn[ 'source_node' ].id,
+        'source_socket': _socket_index( conn[ 'source_node' ].output_sockets, conn[ 'source_socket' ] ),
+        'target': conn[ 'target_node' ].id,
+        'target_socket': _socket_index( conn[ 'target_node' ].input_sockets, conn[ 'target_socket' ] )
+    }
+
+def _connect_record( graph, nodes, record ):
+    source = nodes[ record[ 'source' ] ]
+    target = nodes[ record[ 'target' ] ]
+    return graph.connect( source, source.output_sockets[ record[ 'source_socket' ] ], target, target.input_sockets[ record[ 'target_socket' ] ] )
+
+def definition_to_dict( definition ):
+    return {
+        'name': definition.name,
+        'nodes': [ node_to_dict( node ) for node in definition.graph.evaluation_order() ],
+        'connections': [ connection_to_dict( conn ) for conn in definition.graph.connections ],
+        'inputs': [ proxy.id for proxy in definition.inputs ],
+        'outputs': [ [ node.id, name ] for node, name in definition.outputs ]
+    }
+
+def definition_from_dict( record, definitions, types=None ):
+    types = types or _node_types()
+    inner = Graph()
+    nodes = {}
+    for node_record in record[ 'nodes' ]:
+        nodes[ node_record[ 'id' ] ] = inner.add_node( node_from_dict( node_record, definitions, types ) )
+    for conn_record in record[ 'connections' ]:
+        _connect_record( inner, nodes, conn_record )
+    definition = GroupDefinition( record[ 'name' ], inner,
+                                  [ nodes[ node_id ] for node_id in record[ 'inputs' ] ],
+                                  [ ( nodes[ node_id ], name ) for node_id, name in record[ 'outputs' ] ] )
+    definition.compile()
+    return definition
+
+def graph_to_dict( graph ):
+    return {
+        'version': 1,
+        'definitions': [ definition_to_dict( definition ) for definition in graph.definitions ],
+        'nodes': [ node_to_dict( node ) for node in graph.evaluation_order() ],
+        'connections': [ connection_to_dict( conn ) for conn in graph.connections ]
+    }
+
+def graph_from_dict( data, types=None ):
+    types = types or _node_types()
+    graph = Graph()
+    definitions = {}
+    for record in data.get( 'definitions', [] ):
+        definition = definition_from_dict( record, definitions, types )
+        definitions[ definition.name ] = definition
+        graph.definitions.append( definition )
+    nodes = {}
+    for record in data[ 'nodes' ]:
+        nodes[ record[ 'id' ] ] = graph.add_node( node_from_dict( record, definitions, types ) )
+    for record in data[ 'connections' ]:
+        _connect_record( graph, nodes, record )
+    return graph
+
+# --- Autosave Journal ---
+AUTOSAVE_DIR = os.environ.get( "VIPR_AUTOSAVE_DIR", os.path.join( os.path.expanduser( "~" ), ".vipr", "autosave" ) )
+
+def _state_from_dict( data, sequence=0 ):
+    # Indexed form of graph_to_dict() that delta records can be applied to
+    connections = {}
+    for record in data[ 'connections' ]:
+        connections[ ( record[ 'target' ], record[ 'target_socket' ] ) ] = record
+    return {
+        'sequence': data.get( 'sequence', sequence ),
+        'definitions': { record[ 'name' ]: record for record in data.get( 'definitions', [] ) },
+        'nodes': { record[ 'id' ]: record for record in data[ 'nodes' ] },
+        'connections': connections
+    }
+
+def _state_to_dict( state ):
+    return {
+        'version': 1,
+        'sequence': state[ 'sequence' ],
+        'definitions': list( state[ 'definitions' ].values() ),
+        'nodes': list( state[ 'nodes' ].values() ),
+        'connections': list( state[ 'connections' ].values() )
+    }
+
+def _apply_record( state, record ):
+    if record[ 'sequence' ] <= state[ 'sequence' ]:
+        return # Already contained in the snapshot
+    state[ 'sequence' ] = record[ 'sequence' ]
+    op = record[ 'op' ]
+    nodes = state[ 'nodes' ]
+    connections = state[ 'connections' ]
+    if op in ( 'add_node', 'absorb' ):
+        for node in record[ 'nodes' ]:
+            nodes[ node[ 'id' ] ] = node
+        for conn in record[ 'connections' ]:
+            connections[ ( conn[ 'target' ], conn[ 'target_socket' ] ) ] = conn
+    elif op in ( 'remove_node', 'remove_nodes', 'detach' ):
+        for node_id in record[ 'nodes' ]:
+            nodes.pop( node_id, None )
+        for key in record[ 'connections' ]:
+            connections.pop( tuple( key ), None )
+    elif op == 'connect':
+        conn = record[ 'connection' ]
+        connections[ ( conn[ 'target' ], conn[ 'target_socket' ] ) ] = conn
+    elif op == 'disconnect':
+        connections.pop( tuple( record[ 'connection' ] ), None )
+    elif op == 'set_value':
+        nodes[ record[ 'node' ] ][ 'value' ] = record[ 'value' ]
+    elif op == 'set_rect':
+        nodes[ record[ 'node' ] ][ 'rect' ] = record[ 'rect' ]
+    elif op == 'pan': # Written by versions whose minimap moved every node
+        for node in nodes.values():
+            node[ 'rect' ] = [ node[ 'rect' ][ 0 ] + record[ 'dx' ], node[ 'rect' ][ 1 ] + record[ 'dy' ] ] + node[ 'rect' ][ 2: ]
+    elif op == 'move_nodes':
+        for node_id, x, y in record[ 'positions' ]:
+            nodes[ node_id ][ 'rect' ] = [ x, y ] + nodes[ node_id ][ 'rect' ][ 2: ]
+    elif op == 'add_definition':
+        state[ 'definitions' ][ record[ 'definition' ][ 'name' ] ] = record[ 'definition' ]
+    elif op == 'remove_definition':
+        state[ 'definitions' ].pop( record[ 'definition' ], None )
+
+def load_autosave( directory=AUTOSAVE_DIR ):
+    # Snapshot plus every journal record written after it; None if there is nothing to recover
+    try:
+        with open( os.path.join( directory, "snapshot.json" ) ) as f:
+            state = _state_from_dict( json.load( f ) )
+    except ( OSError, ValueError ):
+        return None
+    try:
+        with open( os.path.join( directory, "journal.jsonl" ) ) as f:
+            for line in f:
+                try:
+                    record = json.loads( line )
+                except ValueError:
+                    break # Torn write at the moment of the crash
+                _apply_record( state, record )
+    except OSError:
+        pass
+    return _state_to_dict( state )
+
+class Journal:
+    # --- Append-only autosave journal for crash recovery ---
+    # Graph changes become small delta records on the main thread; a background
+    # writer appends them to the journal and applies them to its own indexed copy
+    # of the state, which it periodically compacts into a fresh snapshot.
+    COMPACT_EVERY = 2000
+
+    def __init__( self, graph, directory=AUTOSAVE_DIR ):
+        os.makedirs( directory, exist_ok=True )
+        self.snapshot_path = os.path.join( directory, "snapshot.json" )
+        self.journal_path = os.path.join( directory, "journal.jsonl" )
+        self.state = _state_from_dict( graph_to_dict( graph ) ) # Owned by the writer thread from here on
+        self.sequence = 0
+        self.queue = queue.Queue()
+        self.queue.put( { 'op': 'compact' } ) # Start from a snapshot of the current graph
+        self.thread = threading.Thread( target=self._run, name="vipr-journal", daemon=True )
+        self.thread.start()
+        self.graph = graph
+        graph.listeners.append( self.record )
+
+    def record( self, change ):
+        op = change[ 'op' ]
+        if op == 'add_node':
+            record = { 'nodes': [ node_to_dict( change[ 'node' ] ) ], 'connections': [] }
+        elif op == 'remove_node':
+            record = { 'nodes': [ change[ 'node' ].id ], 'connections': [ self._key( conn ) for conn in change[ 'connections' ] ] }
+        elif op == 'absorb':
+            record = { 'nodes': [ node_to_dict( node ) for node in change[ 'nodes' ] ], 'connections': [ connection_to_dict( conn ) for conn in change[ 'connections' ] ] }
+        elif op in ( 'remove_nodes', 'detach' ):
+            record = { 'nodes': [ node.id for node in change[ 'nodes' ] ], 'connections': [ self._key( conn ) for conn in change[ 'connections' ] ] }
+        elif op == 'connect':
+            record = { 'connection': connection_to_dict( change[ 'connection' ] ) }
+        elif op == 'disconnect':
+            record = { 'connection': self._key( change[ 'connection' ] ) }
+        elif op == 'set_value':
+            record = { 'node': change[ 'node' ].id, 'value': _to_json_value( change[ 'new' ] ) }
+        elif op == 'set_rect':
+            record = { 'node': change[ 'node' ].id, 'rect': list( change[ 'new' ] ) }
+        elif op == 'move_nodes':
+            record = { 'positions': [ [ node.id, x, y ] for node, ( x, y ) in zip( change[ 'nodes' ], change[ 'new' ] ) ] }
+        elif op == 'add_definition':
+            record = { 'definition': definition_to_dict( change[ 'definition' ] ) }
+        elif op == 'remove_definition':
+            record = { 'definition': change[ 'definition' ].name }
+        else:
+            return
+        self.sequence += 1
+        record[ 'op' ] = op
+        record[ 'sequence' ] = self.sequence
+        self.queue.put( record )
+
+    def _key( self, conn ):
+        return [ conn[ 'target_node' ].id, _socket_index( conn[ 'target_node' ].input_sockets, conn[ 'target_socket' ] ) ]
+
+    def close( self ):
+        # Compact so the next startup only has to read the snapshot
+        self.graph.listeners.remove( self.record )
+        self.queue.put( { 'op': 'compact' } )
+        self.queue.put( None )
+        self.thread.join()
+
+    def _run( self ):
+        journal = open( self.journal_path, "a" )
+        pending = 0
+        while True:
+            record = self.queue.get()
+            if record is None:
+                break
+            if record[ 'op' ] == 'compact' or pending >= self.COMPACT_EVERY:
+                journal = self._compact( journal )
+                pending = 0
+                if record[ 'op' ] == 'compact':
+                    continue
+            _apply_record( self.state, record )
+            journal.write( json.dumps( record ) + "\n" )
+            pending += 1
+            if self.queue.empty():
+                journal.flush()
+        journal.close()
+
+    def _compact( self, journal ):
+        temp_path = self.snapshot_path + ".tmp"
+        with open( temp_path, "w" ) as f:
+            json.dump( _state_to_dict( self.state ), f )
+        os.replace( temp_path, self.snapshot_path )
+        # Records up to the snapshot's sequence are now redundant
+        journal.close()
+        return open( self.journal_path, "w" )
+
+# --- Result Cache ---
+# Node results persisted across sessions. A node's key is a hash of its type,
+# its constant value and the keys of everything connected upstream, so it only
+# changes when the subgraph feeding the node changes. Only results that took at
+# least CACHE_MIN_SECONDS to compute are written; misses are answered from the
+# in-memory index without touching the disk. Entries are evicted least recently
+# used first once the directory exceeds CACHE_MAX_BYTES (0 disables the cache).
+# The editor and the server workers may share the directory, so a process indexes
+# it again before storing whenever someone else has changed it since it last
+# looked; the limit then holds for all of them together.
+CACHE_DIR = os.environ.get( "VIPR_CACHE_DIR", os.path.join( os.path.expanduser( "~" ), ".vipr", "cache" ) )
+CACHE_MAX_BYTES = int( os.environ.get( "VIPR_CACHE_BYTES", 256 * 1024 * 1024 ) )
+CACHE_MIN_SECONDS = 0.005
+CACHE_KEY_VERSION = b"vipr-result-2" # Bump when compute semantics change
+
+def _digest_value( digest, value ):
+    # Feed a constant into a hash without converting big values to text
+    digest.update( type( value ).__name__.encode() )
+    if isinstance( value, int ) and not isinstance( value, bool ):
+        digest.update( value.to_bytes( value.bit_length() // 8 + 1, "little", signed=True ) )
+    elif _is_array( value ):
+        digest.update( ( "%s%s" % ( value.dtype.str, value.shape ) ).encode() )
+        digest.update( value.tobytes() )
+    elif hasattr( value, "typecode" ): # array.array
+        digest.update( value.typecode.encode() )
+        digest.update( value.tobytes() )
+    else:
+        digest.update( repr( value ).encode() )
+
+class ResultCache:
+    def __init__( self, directory=CACHE_DIR, max_bytes=CACHE_MAX_BYTES, min_seconds=CACHE_MIN_SECONDS ):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.min_seconds = min_seconds
+        self.keys = weakref.WeakKeyDictionary() # Node -> key of its last computation
+        self.definition_keys = weakref.WeakKeyDictionary() # GroupDefinition -> content hash
+        self.entries = collections.OrderedDict() # Key -> file size, least recently used first
+        self.size = 0
+        self.hits = 0
+        self.stores = 0
+        self._scan()
+        self._evict() # The limit may have been lowered since the last run
+        self.seen = self._directory_mtime() # Directory mtime after this process's last change
+
+    def _directory_mtime( self ):
+        try:
+            return os.stat( self.directory ).st_mtime_ns
+        except OSError:
+            return None
+
+    def _scan( self ):
+        # Index the entries on disk; hits touch their file, so mtime is the last use
+        try:
+            files = [ entry for entry in os.scandir( self.directory ) if entry.name.endswith( ".pickle" ) ]
+        except OSError:
+            files = []
+        found = []
+        for entry in files:
+            try:
+                stat = entry.stat()
+            except OSError:
+                continue # Evicted by another process meanwhile
+            found.append( ( stat.st_mtime, entry.name[ :-len( ".pickle" ) ], stat.st_size ) )
+        found.sort()
+        self.entries = collections.OrderedDict( ( key, size ) for mtime, key, size in found )
+        self.size = sum( size for mtime, key, size in found )
+
+    def node_key( self, node ):
+        digest = hashlib.sha256( CACHE_KEY_VERSION )
+        digest.update( type( node ).__name__.encode() )
+        if type( node ).__name__ in VALUE_NODE_TYPES:
+            _digest_value( digest, node.value )
+        elif isinstance( node, GroupNode ):
+            digest.update( self.definition_key( node.definition ) )
+        elif isinstance( node, AsyncNode ): # Its output comes from outside, so hash what was delivered
+            for name in sorted( node.values ):
+                _digest_value( digest, node.values[ name ] )
+        for sock in node.input_sockets:
+            conn = sock[ 'connection' ]
+            if conn is None:
+                digest.update( b"-" )
+                continue
+            source = conn[ 'source_node' ]
+            upstream = self.keys.get( source ) or self.node_key( source )
+            digest.update( upstream.encode() )
+            digest.update( conn[ 'source_socket' ][ 'name' ].encode() )
+        key = digest.hexdigest()
+        if not isinstance( node, AsyncNode ): # Deliveries change its key without a recompute
+            self.keys[ node ] = key
+        return key
+
+    def definition_key( self, definition ):
+        key = self.definition_keys.get( definition )
+        if key is None:
+            key = hashlib.sha256( json.dumps( definition_to_dict( definition ), sort_keys=True ).encode() ).digest()
+            self.definition_keys[ definition ] = key
+        return key
+
+    def compute( self, node ):
+        # node.compute(), or its stored values if the same subgraph was computed before
+        if not node.output_sockets or isinstance( node, AsyncNode ): # Output nodes only copy a value through; I/O must run
+            node.compute()
+            return
+        key = self.node_key( node )
+        if key in self.entries and self._load( key, node ):
+            return
+        started = time.perf_counter()
+        node.compute()
+        if self.max_bytes and time.perf_counter() - started >= self.min_seconds:
+            self._store( key, node.values )
+
+    def _path( self, key ):
+        return os.path.join( self.directory, key + ".pickle" )
+
+    def _load( self, key, node ):
+        path = self._path( key )
+        try:
+            with open( path, "rb" ) as f:
+                values = pickle.load( f )
+            os.utime( path )
+        except ( OSError, pickle.UnpicklingError, EOFError ):
+            self.size -= self.entries.pop( key ) # Evicted by another process, or torn
+            return False
+        node.values.update( values )
+        if isinstance( node, GroupNode ):
+            node.last_inputs = None # Its own skip check only covers values it computed itself
+        self.entries.move_to_end( key )
+        self.hits += 1
+        return True
+
+    def _store( self, key, values ):
+        try:
+            data = pickle.dumps( dict( values ), pickle.HIGHEST_PROTOCOL )
+        except ( pickle.PicklingError, TypeError, AttributeError ):
+            return
+        if len( data ) > self.max_bytes:
+            return
+        os.makedirs( self.directory, exist_ok=True )
+        if self._directory_mtime() != self.seen:
+            self._scan() # Another process stored or evicted entries
+        temp_path = self._path( key ) + ".tmp"
+        with open( temp_path, "wb" ) as f:
+            f.write( data )
+        os.replace( temp_path, self._path( key ) ) # Readers never see a partial entry
+        self.size += len( data ) - self.entries.pop( key, 0 )
+        self.entries[ key ] = len( data )
+        self.stores += 1
+        self._evict()
+        self.seen = self._directory_mtime()
+
+    def _evict( self ):
+        while self.size > self.max_bytes:
+            old_key, old_size = self.entries.popitem( last=False )
+            self.size -= old_size
+            try:
+                os.remove( self._path( old_key ) )
+            except OSError:
+                pass
+
+# --- Evaluation Server ---
+# Headless JSON-over-HTTP evaluation for other tools. Requests carry a graph
+# (graph_to_dict format) or the hash of a graph sent earlier, plus input values
+# by node id; the response has the value of every Display/Preview node. Graphs
+# are evaluated in a pool of warm worker processes that keep built graphs cached
+# by content hash, so repeated requests skip building and only recompute the
+# nodes downstream of changed inputs. pygame is never imported.
+OUTPUT_NODE_TYPES = ( 'DisplayNode', 'PreviewNode' )
+WORKER_GRAPH_CACHE = 32
+SERVER_GRAPH_CACHE = 256
+
+_worker_graphs = collections.OrderedDict() # Graph hash -> ( graph, nodes by id, constants ), per worker process
+_worker_node_types = None
+
+def _json_result( value ):
+    if isinstance( value, int ) and value.bit_length() > 10000:
+        return format_value( value ) # Too large for JSON number conversion
+    return _to_json_value( value )
+
+def _evaluate_in_worker( graph_hash, graph_data, inputs ):
+    # Returns None if graph_data is needed but was not sent
+    entry = _worker_graphs.get( graph_hash )
+    if entry is None:
+        if graph_data is None:
+            return None
+        graph = graph_from_dict( graph_data, _worker_node_types )
+        graph.result_cache = _worker_result_cache
+        constants = { node: node.value for node in graph.nodes if type( node ).__name__ in VALUE_NODE_TYPES }
+        entry = ( graph, { node.id: node for node in graph.nodes }, constants )
+        _worker_graphs[ graph_hash ] = entry
+        if len( _worker_graphs ) > WORKER_GRAPH_CACHE:
+            _worker_graphs.popitem( last=False )
+    else:
+        _worker_graphs.move_to_end( graph_hash )
+    graph, nodes, constants = entry
+
+    bound = {}
+    for node_id, value in inputs.items():
+        node = nodes.get( int( node_id ) )
+        if node not in constants:
+            raise KeyError( "Input %s is not a value node" % node_id )
+        bound[ node ] = value
+    inputs = bound
+    for node, value in constants.items():
+        if node not in inputs and node.value is not value:
+            graph.set_value( node, value ) # Inputs of earlier requests do not carry over
+    for node, value in inputs.items():
+        graph.set_value( node, array_from_list( value ) if isinstance( node, ArrayNode ) else value )
+    try:
+        graph.evaluate()
+    except Exception:
+        del _worker_graphs[ graph_hash ] # Left half evaluated; the next request builds it again
+        raise
+    return { str( node.id ): _json_result( node.display_value ) for node in graph.nodes if type( node ).__name__ in OUTPUT_NODE_TYPES }
+
+_worker_result_cache = None
+
+def _init_worker( allow_io ):
+    global _worker_result_cache, _worker_node_types
+    _worker_node_types = headless_node_types( allow_io )
+    signal.signal( signal.SIGINT, signal.SIG_IGN ) # The server process owns Ctrl+C and shuts the pool down
+    if CACHE_MAX_BYTES:
+        _worker_result_cache = ResultCache()
+
+def _warm_worker( index ):
+    return 'pygame' in sys.modules # Workers must stay headless
+
+def graph_hash( graph_data ):
+    return hashlib.sha256( json.dumps( graph_data, sort_keys=True, separators=( ",", ":" ) ).encode() ).hexdigest()
+
+class ServerMetrics:
+    # --- Request counts, throughput and latency percentiles ---
+    def __init__( self, window=1000 ):
+        self.lock = threading.Lock()
+        self.started = time.perf_counter()
+        self.requests = 0
+        self.errors = 0
+        self.graph_hits = 0
+        self.graph_misses = 0
+        self.recent = collections.deque( maxlen=window ) # ( finished at, latency )
+
+    def count_graph( self, hit ):
+        with self.lock:
+            if hit:
+                self.graph_hits += 1
+            else:
+                self.graph_misses += 1
+
+    def record( self, latency, ok ):
+        with self.lock:
+            self.requests += 1
+            if not ok:
+                self.errors += 1
+            self.recent.append( ( time.perf_counter(), latency ) )
+
+    def report( self ):
+        with self.lock:
+            now = time.perf_counter()
+            latencies = sorted( latency for finished, latency in self.recent )
+            last_minute = sum( 1 for finished, latency in self.recent if now - finished < 60 )
+            uptime = now - self.started
+            report = {
+                'requests': self.requests,
+                'errors': self.errors,
+                'uptime_s': round( uptime, 3 ),
+                'throughput_rps': round( self.requests / uptime, 3 ) if uptime else 0,
+                'recent_rps': round( last_minute / min( 60, uptime ), 3 ) if uptime else 0,
+                'graph_cache': { 'hits': self.graph_hits, 'misses': self.graph_misses }
+            }
+        if latencies:
+            def percentile( fraction ):
+                return round( latencies[ min( len( latencies ) - 1, int( fraction * len( latencies ) ) ) ] * 1000, 3 )
+            report[ 'latency_ms' ] = {
+                'mean': round( sum( latencies ) / len( latencies ) * 1000, 3 ),
+                'p50': percentile( 0.5 ), 'p95': percentile( 0.95 ), 'p99': percentile( 0.99 ),
+                'max': round( latencies[ -1 ] * 1000, 3 )
+            }
+        return report
+
+class EvaluationService:
+    # --- Worker pool plus the graphs known by hash ---
+    def __init__( self, workers=None, allow_io=False ):
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = concurrent.futures.ProcessPoolExecutor( max_workers=self.workers, initializer=_init_worker, initargs=( allow_io, ) )
+        self.graphs = collections.OrderedDict() # Hash -> graph data, for hash-only requests
+        self.graphs_lock = threading.Lock()
+        self.metrics = ServerMetrics()
+        # Start every worker now so the first requests do not pay for process startup
+        list( self.pool.map( _warm_worker, range( self.workers ) ) )
+
+    def evaluate( self, request ):
+        # request: { 'graph': {...} or 'graph_hash': str, 'inputs': { node id: value } }
+        inputs = request.get( 'inputs', {} )
+        with self.graphs_lock:
+            if 'graph' in request:
+                key = graph_hash( request[ 'graph' ] )
+                self.graphs[ key ] = request[ 'graph' ]
+            else:
+                key = request[ 'graph_hash' ]
+                if key not in self.graphs:
+                    raise KeyError( "Unknown graph_hash; send the graph instead" )
+            self.graphs.move_to_end( key )
+            if len( self.graphs ) > SERVER_GRAPH_CACHE:
+                self.graphs.popitem( last=False )
+            graph_data = self.graphs[ key ]
+
+        # Ask without the graph first; only a worker that has not built it yet needs it
+        outputs = self.pool.submit( _evaluate_in_worker, key, None, inputs ).result()
+        self.metrics.count_graph( outputs is not None )
+        if outputs is None:
+            outputs = self.pool.submit( _evaluate_in_worker, key, graph_data, inputs ).result()
+        return { 'graph_hash': key, 'outputs': outputs }
+
+    def close( self ):
+        self.pool.shutdown()
+
+def serve( host="127.0.0.1", port=8765, workers=None, allow_io=False ):
+    import http.server
+
+    service = EvaluationService( workers, allow_io )
+
+    class Handler( http.server.BaseHTTPRequestHandler ):
+        def _reply( self, status, payload ):
+            body = json.dumps( payload ).encode()
+            self.send_response( status )
+            self.send_header( "Content-Type", "application/json" )
+            self.send_header( "Content-Length", str( len( body ) ) )
+            self.end_headers()
+            self.wfile.write( body )
+
+        def _fail( self, status, error, started ):
+            service.metrics.record( time.perf_counter() - started, False )
+            self._reply( status, { 'error': "%s: %s" % ( type( error ).__name__, error ) } )
+
+        def do_GET( self ):
+            if self.path == "/metrics":
+                self._reply( 200, service.metrics.report() )
+            else:
+                self._reply( 404, { 'error': "Not found" } )
+
+        def do_POST( self ):
+            if self.path != "/evaluate":
+                self._reply( 404, { 'error': "Not found" } )
+                return
+            started = time.perf_counter()
+            if self.headers.get( "Content-Type", "" ).split( ";" )[ 0 ].strip().lower() != "application/json":
+                # Browsers send text/plain cross-origin without asking first; JSON needs a preflight
+                service.metrics.record( time.perf_counter() - started, False )
+                self._reply( 415, { 'error': "Content-Type must be application/json" } )
+                return
+            try:
+                request = json.loads( self.rfile.read( int( self.headers.get( "Content-Length", 0 ) ) ) )
+                response = service.evaluate( request )
+            except ( ValueError, KeyError, TypeError, IndexError, ArithmeticError ) as error:
+                self._fail( 400, error, started ) # Malformed request, or a graph that fails to evaluate (e.g. 10.0 ** 1000)
+                return
+            except Exception as error: # Anything else, including a worker that died, still gets an answer
+                self._fail( 500, error, started )
+                return
+            service.metrics.record( time.perf_counter() - started, True )
+            self._reply( 200, response )
+
+        def log_message( self, format, *args ):
+            pass # Metrics replace per-request logging
+
+    httpd = http.server.ThreadingHTTPServer( ( host, port ), Handler )
+    print( "ViPr evaluation server on http://%s:%d (%d workers)" % ( host, httpd.server_address[ 1 ], service.workers ) )
+
+    def _terminate( signum, frame ):
+        raise KeyboardInterrupt # Same clean shutdown as Ctrl+C under process managers
+    signal.signal( signal.SIGTERM, _terminate )
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+        service.close()
+        print( json.dumps( service.metrics.report() ) )
+
+# --- Monte Carlo ---
+# Re-samples every random source node N times from a seeded NumPy Generator and
+# evaluates a copy of the graph once, vectorized over all samples. Each random
+# node draws from its own stream derived from ( seed, node id ), so results are
+# reproducible from the seed and unaffected by unrelated random nodes.
+# Integer samples are int64, so products that overflow it wrap around.
+MONTE_CARLO_SAMPLES = 100000
+MONTE_CARLO_PERCENTILES = ( 5, 50, 95 )
+
+def _draw_samples( node, samples, seed ):
+    generator = _numpy().random.default_rng( [ seed, node.id ] )
+    if isinstance( node, RndIntegerNode ):
+        return generator.integers( 0, 65535, size=samples, endpoint=True ) # Same range as random.randint( 0, 65535 )
+    return generator.uniform( 0, 65535, size=samples )
+
+def sample_statistics( value, samples ):
+    # Distribution of one output; NaN and inf samples (division by zero) are counted as errors
+    numpy = _numpy()
+    if isinstance( value, str ):
+        return { 'value': format_value( value ) }
+    try:
+        values = numpy.asarray( value, dtype=numpy.float64 ).reshape( -1 ) # Bools become 0/1, so the mean is a probability
+    except ( TypeError, ValueError, OverflowError ):
+        return { 'value': format_value( value ) }
+    finite = values[ numpy.isfinite( values ) ]
+    stats = { 'samples': samples, 'errors': int( values.size - finite.size ) }
+    if finite.size:
+        stats[ 'mean' ] = float( finite.mean() )
+        stats[ 'std' ] = float( finite.std() )
+        stats[ 'min' ] = float( finite.min() )
+        for percentile, result in zip( MONTE_CARLO_PERCENTILES, numpy.percentile( finite, MONTE_CARLO_PERCENTILES ) ):
+            stats[ 'p%d' % percentile ] = float( result )
+        stats[ 'max' ] = float( finite.max() )
+    return stats
+
+def monte_carlo( graph, samples=MONTE_CARLO_SAMPLES, seed=0 ):
+    # { output node id: statistics }; runs on a copy, so the graph itself is untouched
+    if _numpy() is None:
+        raise RuntimeError( "Monte Carlo mode needs NumPy" )
+    copy = graph_from_dict( graph_to_dict( graph ) )
+    for node in copy.nodes:
+        if isinstance( node, AsyncNode ):
+            # Reuse the graph's I/O results; reading, writing or running a program again could block and repeat side effects
+            original = graph.find_node( node.id )
+            node.values.update( original.values )
+            node.status = original.status
+            copy.held.add( node )
+    for owner in [ copy ] + [ definition.graph for definition in copy.definitions ]:
+        for node in owner.nodes:
+            if isinstance( node, ( RndIntegerNode, RndFloatNode ) ):
+                owner.set_value( node, _draw_samples( node, samples, seed ) ) # Also re-infers them as arrays
+    copy.evaluate()
+    return { node.id: sample_statistics( node.display_value, samples ) for node in copy.nodes if type( node ).__name__ in OUTPUT_NODE_TYPES }
+
+def statistics_text( stats ):
+    # One short line for drawing under an output node
+    if 'mean' not in stats:
+        return stats.get( 'value', "no samples" )
+    text = "mean %s sd %s [%s, %s]" % tuple( format_value( stats[ key ], 10 ) for key in ( 'mean', 'std', 'p5', 'p95' ) )
+    if stats[ 'errors' ]:
+        text += " %d errors" % stats[ 'errors' ]
+    return text
+
+# --- Async Runner ---
+class AsyncRunner:
+    # --- Background asyncio loop for AsyncNode requests ---
+    # submit() is called from Graph.evaluate() on the main thread. Finished results
+    # wait in a queue until deliver() passes them to the graph at the start of a
+    # frame, so nodes and the graph are only ever touched on the main thread and
+    # any number of slow requests can be in flight without stalling a frame.
+    def __init__( self ):
+        self.loop = asyncio.new_event_loop()
+        self.results = queue.Queue() # ( weakref to node, request number, values or error )
+        self.pending = weakref.WeakKeyDictionary() # Node -> future of its latest request
+        self.thread = threading.Thread( target=self.loop.run_forever, name="vipr-async", daemon=True )
+        self.thread.start()
+
+    def submit( self, node ):
+        node.request += 1
+        node.status = "..."
+        previous = self.pending.get( node )
+        if previous is not None:
+            previous.cancel() # Its inputs changed; the old answer is no longer wanted
+        request = self._run( weakref.ref( node ), node.request, node.run( *node.input_values() ) )
+        self.pending[ node ] = asyncio.run_coroutine_threadsafe( request, self.loop )
+
+    async def _run( self, node_ref, number, request ):
+        try:
+            result = await asyncio.wait_for( request, IO_TIMEOUT )
+        except asyncio.CancelledError:
+            raise
+        except Exception as error: # Reported on the node; nothing else would see it on this thread
+            result = error
+        self.results.put( ( node_ref, number, result ) )
+
+    def deliver( self, graph ):
+        # Results of superseded requests and of nodes removed since are dropped
+        while True:
+            try:
+                node_ref, number, result = self.results.get_nowait()
+            except queue.Empty:
+                return
+            node = node_ref()
+            if node is None or node.request != number or graph.find_node( node.id ) is not node:
+                continue
+            self.pending.pop( node, None )
+            if isinstance( result, Exception ):
+                node.fail( result )
+                continue
+            node.status = None
+            graph.deliver( node, result )
+
+    def close( self ):
+        for future in list( self.pending.values() ):
+            future.cancel()
+        self.loop.call_soon_threadsafe( self.loop.stop )
+        self.thread.join( timeout=1.0 )
+
+# --- Input Sources ---
+# main() reads all input through an input source: live pygame input, live input
+# that is also written to a session file, or a session file replayed with a
+# fixed timestep under any video driver (e.g. SDL's dummy driver), timing every
+# frame. Nodes ask input_ticks() and input_mouse_pos() instead of pygame, so a
+# replay sees exactly the recorded input. Session files are JSON lines: a header
+# with the starting graph, then [ mouse x, mouse y, modifiers, events ] per frame.
+FRAME_RATE = 60
+RECORDED_EVENTS = ( 'QUIT', 'KEYDOWN', 'KEYUP', 'TEXTINPUT', 'MOUSEBUTTONDOWN', 'MOUSEBUTTONUP', 'MOUSEMOTION', 'MOUSEWHEEL' )
+_input = None # Input source of the running main()
+
+def input_ticks():
+    return _input.ticks() if _input else pygame.time.get_ticks()
+
+def input_mouse_pos():
+    return _input.mouse_pos if _input else pygame.mouse.get_pos()
+
+def _event_to_list( event ):
+    attributes = {}
+    for key, value in event.dict.items():
+        if isinstance( value, tuple ):
+            value = list( value )
+        if value is None or isinstance( value, ( bool, int, float, str, list ) ):
+            attributes[ key ] = value
+    return [ event.type, attributes ]
+
+def _event_from_list( record ):
+    event_type, attributes = record
+    return pygame.event.Event( event_type, { key: tuple( value ) if isinstance( value, list ) else value for key, value in attributes.items() } )
+
+class LiveInput:
+    replaying = False
+
+    def __init__( self ):
+        self.mouse_pos = ( 0, 0 )
+        self.mods = 0
+        self.clock = None
+
+    def initial_graph( self ):
+        return None # Restore the autosaved session
+
+    def start( self, graph ):
+        self.clock = pygame.time.Clock()
+
+    def poll( self ):
+        self.mouse_pos = pygame.mouse.get_pos()
+        self.mods = pygame.key.get_mods()
+        return pygame.event.get()
+
+    def ticks( self ):
+        return pygame.time.get_ticks()
+
+    def end_frame( self ):
+        self.clock.tick( FRAME_RATE )
+
+    def close( self ):
+        pass
+
+class RecordingInput( LiveInput ):
+    def __init__( self, path, seed=0 ):
+        super().__init__()
+        self.path = path
+        self.seed = seed
+        self.file = None
+        self.recorded_types = None
+
+    def start( self, graph ):
+        super().start( graph )
+        random.seed( self.seed ) # Random nodes created during the session come out the same in a replay
+        self.recorded_types = set( getattr( pygame, name ) for name in RECORDED_EVENTS if hasattr( pygame, name ) )
+        self.file = open( self.path, "w" )
+        self.file.write( json.dumps( { 'version': 1, 'seed': self.seed, 'next_id': Node.next_id, 'graph': graph_to_dict( graph ) } ) + "\n" )
+
+    def poll( self ):
+        events = super().poll()
+        recorded = [ _event_to_list( event ) for event in events if event.type in self.recorded_types ]
+        self.file.write( json.dumps( [ self.mouse_pos[ 0 ], self.mouse_pos[ 1 ], self.mods, recorded ] ) + "\n" )
+        return events
+
+    def close( self ):
+        self.file.close()
+        print( "Session recorded to %s" % self.path )
+
+class ReplayInput:
+    replaying = True # The replay must not touch the autosave or the result cache
+
+    def __init__( self, path, timings_path=None ):
+        self.file = open( path )
+        self.header = json.loads( self.file.readline() )
+        self.timings_path = timings_path
+        self.mouse_pos = ( 0, 0 )
+        self.mods = 0
+        self.frame = 0
+        self.frame_start = None
+        self.frame_times = []
+
+    def initial_graph( self ):
+        return self.header[ 'graph' ]
+
+    def start( self, graph ):
+        random.seed( self.header[ 'seed' ] )
+        Node.next_id = max( Node.next_id, self.header[ 'next_id' ] )
+
+    def poll( self ):
+        self.frame_start = time.perf_counter()
+        pygame.event.pump() # Keep the (dummy) window responsive; real input is ignored
+        line = self.file.readline()
+        if not line:
+            return [ pygame.event.Event( pygame.QUIT ) ]
+        x, y, self.mods, events = json.loads( line )
+        self.mouse_pos = ( x, y )
+        return [ _event_from_list( record ) for record in events ]
+
+    def ticks( self ):
+        return self.frame * 1000 // FRAME_RATE # Fixed timestep, however long frames really take
+
+    def end_frame( self ):
+        self.frame_times.append( time.perf_counter() - self.frame_start )
+        self.frame += 1
+
+    def report( self ):
+        times = sorted( self.frame_times )
+        if not times:
+            return { 'frames': 0 }
+        def percentile( fraction ):
+            return round( times[ min( len( times ) - 1, int( fraction * len( times ) ) ) ] * 1000, 3 )
+        slowest = sorted( range( len( self.frame_times ) ), key=self.frame_times.__getitem__, reverse=True )[ :5 ]
+        return {
+            'frames': len( times ),
+            'total_s': round( sum( times ), 3 ),
+            'frame_ms': { 'mean': round( sum( times ) / len( times ) * 1000, 3 ),
+                          'p50': percentile( 0.5 ), 'p95': percentile( 0.95 ), 'p99': percentile( 0.99 ), 'max': round( times[ -1 ] * 1000, 3 ) },
+            'slowest_frames': [ [ index, round( self.frame_times[ index ] * 1000, 3 ) ] for index in slowest ],
+            'frame_times_ms': [ round( seconds * 1000, 3 ) for seconds in self.frame_times ]
+        }
+
+    def close( self ):
+        self.file.close()
+        report = self.report()
+        if self.timings_path:
+            with open( self.timings_path, "w" ) as f:
+                json.dump( report, f )
+        summary = dict( report )
+        summary.pop( 'frame_times_ms', None )
+        print( json.dumps( summary ) )
+
+# --- Main Application ---
+def main( monte_carlo_seed=0, input_source=None ):
+    global _input
+    _input = input_source or LiveInput()
+    startup = [ ( "import", time.perf_counter() - _process_start ) ]
+    phase_start = time.perf_counter()
+    _load_pygame()
+    # Only the subsystems ViPr uses; pygame.init() would also start audio, joystick, etc.
+    pygame.display.init()
+    pygame.font.init()
+    startup.append( ( "pygame", time.perf_counter() - phase_start ) )
+
+    phase_start = time.perf_counter()
+    font = load_font( 24 )
+    small_font = load_font( 20 )
+    startup.append( ( "fonts", time.perf_counter() - phase_start ) )
+
+    phase_start = time.perf_counter()
+    SCREEN_WIDTH = 1200
+    SCREEN_HEIGHT = 800
+    screen = pygame.display.set_mode( ( SCREEN_WIDTH, SCREEN_HEIGHT ) )
+    pygame.display.set_caption( "ViPr - Visual Programmer" )
+    connection_renderer = ConnectionRenderer( ( SCREEN_WIDTH, SCREEN_HEIGHT ) )
+    startup.append( ( "window", time.perf_counter() - phase_start ) )
+
+    phase_start = time.perf_counter()
+    # --- Restore the last session from the autosave journal ---
+    saved_state = _input.initial_graph() or load_autosave()
+    if saved_state and saved_state[ 'nodes' ]:
+        graph = graph_from_dict( saved_state )
+        # Programs, writes and messages of the last session are not repeated on opening, only after an input changes
+        graph.held.update( node for node in graph.nodes if isinstance( node, AsyncNode ) and node.side_effects )
+    else:
+        graph = Graph( [ # --- Default nodes on opening ---
+            IntegerNode( 100, 100, value=5 ),
+            IntegerNode( 100, 250, value=10 ),
+            AddNode( 350, 150 ),
+            DisplayNode( 600, 150 )
+        ] )
+    if CACHE_MAX_BYTES and not _input.replaying:
+        graph.result_cache = ResultCache()
+    if not _input.replaying: # Replays compute I/O inline, so results land on the same frames
+        graph.async_runner = AsyncRunner()
+    minimap = Minimap( ( SCREEN_WIDTH, SCREEN_HEIGHT ), graph )
+    nodes = graph.nodes
+    connections = graph.connections
+    history = History( graph )
+    selection = Selection( graph )
+    journal = None if _input.replaying else Journal( graph )
+    # Statistics text drawn under each output node after a Monte Carlo run (Ctrl+M);
+    # any edit other than moving nodes makes them stale
+    monte_carlo_overlay = {}
+    def clear_monte_carlo( change ):
+        if change[ 'op' ] not in ( 'set_rect', 'move_nodes' ):
+            monte_carlo_overlay.clear()
+    graph.listeners.append( clear_monte_carlo )
+    startup.append( ( "graph", time.perf_counter() - phase_start ) )
+    phase_start = time.perf_counter()
+
+    global_connection_state = {
+        'is_drawing_connection': False,
+        'connection_start_node': None,
+        'connection_start_socket': None,
+    }
+    
+    context_menu = None
+
+    # --- Multi-selection gestures in progress ---
+    selection_drag = None # Nodes moved together, their start corners and the latest mouse position
+    rubber_band = None # Corner where the band started and whether it adds to the selection
+    
+    # --- Track which node is being edited ---
+    editing_node = None
+
+    # --- View ---
+    # Node rects are canvas coordinates; the view offset is where the canvas origin
+    # is on screen (moved by clicking the minimap). Mouse events reach the nodes in
+    # canvas coordinates, the context menu and the minimap in screen coordinates.
+    view_offset = ( 0, 0 )
+
+    running = True
+    _input.start( graph )
+
+    while running:
+        events = _input.poll()
+        mouse_pos = ( _input.mouse_pos[ 0 ] - view_offset[ 0 ], _input.mouse_pos[ 1 ] - view_offset[ 1 ] )
+        
+        # --- Determine which node is being edited ---
+        editing_node = None
+        for n in nodes:
+            if isinstance( n, (IntegerNode, FloatNode, StringNode, ArrayNode) ) and n.editing:
+                editing_node = n
+                break
+
+        # --- Event Handling ---
+        for event in events:
+            screen_event = event
+            if view_offset != ( 0, 0 ) and hasattr( event, "pos" ):
+                event = pygame.event.Event( event.type, dict( event.dict, pos=( event.pos[ 0 ] - view_offset[ 0 ], event.pos[ 1 ] - view_offset[ 1 ] ) ) )
+
+            if event.type == pygame.QUIT:
+                running = False
+                
+            # --- Pass keyboard events to the editing node FIRST ---
+            if editing_node:
+                editing_node.handle_event( event, global_connection_state, graph )
+                # If a click happens, check if it's outside the editing node to close it
+                if event.type == pygame.MOUSEBUTTONDOWN and not editing_node.rect.collidepoint( event.pos ):
+                    editing_node.editing = False
+                    editing_node.input_text = str( editing_node.value ) # revert
+                continue # Skip other handlers if we are editing
+
+            # --- DELETE NODE with Delete Key (the whole selection, if any) ---
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_DELETE and len( selection ):
+                    graph.remove_nodes( list( selection ) )
+                    continue
+                if event.key == pygame.K_DELETE:
+                    node_to_delete = None
+                    for node in nodes:
+                        if node.rect.collidepoint( mouse_pos ):
+                            node_to_delete = node
+                            break # Found the node to delete
+                    
+                    if node_to_delete:
+                        graph.remove_node( node_to_delete )
+                        continue # Event handled
+
+                # --- GROUP SELECTED NODES with Ctrl+G ---
+                if event.key == pygame.K_g and event.mod & pygame.KMOD_CTRL:
+                    with history.transaction():
+                        collapse_to_group( graph, list( selection ), "Group %d" % ( len( graph.definitions ) + 1 ) )
+                    continue
+
+                # --- DUPLICATE SELECTED NODES with Ctrl+D ---
+                if event.key == pygame.K_d and event.mod & pygame.KMOD_CTRL:
+                    with history.transaction():
+                        selection.replace( duplicate_nodes( graph, list( selection ) ) )
+                    continue
+
+                # --- MEMORY REPORT with Ctrl+I ---
+                if event.key == pygame.K_i and event.mod & pygame.KMOD_CTRL:
+                    print( json.dumps( memory_report( graph, history ), indent=2 ) )
+                    continue
+
+                # --- AUTO LAYOUT with Ctrl+L ---
+                if event.key == pygame.K_l and event.mod & pygame.KMOD_CTRL:
+                    layout_graph( graph )
+                    continue
+
+                # --- UNDO with Ctrl+Z, REDO with Ctrl+Y or Ctrl+Shift+Z ---
+                if event.key == pygame.K_z and event.mod & pygame.KMOD_CTRL:
+                    if event.mod & pygame.KMOD_SHIFT:
+                        history.redo()
+                    else:
+                        history.undo()
+                    continue
+                if event.key == pygame.K_y and event.mod & pygame.KMOD_CTRL:
+                    history.redo()
+                    continue
+
+                # --- MONTE CARLO RUN with Ctrl+M ---
+                if event.key == pygame.K_m and event.mod & pygame.KMOD_CTRL:
+                    started = time.perf_counter()
+                    try:
+                        results = monte_carlo( graph, MONTE_CARLO_SAMPLES, monte_carlo_seed )
+                    except ( RuntimeError, TypeError, ValueError ) as error:
+                        print( "Monte Carlo run failed: %s" % error )
+                        continue
+                    print( "Monte Carlo: %d samples (seed %d) in %.1f ms" % ( MONTE_CARLO_SAMPLES, monte_carlo_seed, ( time.perf_counter() - started ) * 1000 ) )
+                    monte_carlo_overlay.clear()
+                    for node in nodes:
+                        if node.id in results:
+                            monte_carlo_overlay[ node ] = small_font.render( statistics_text( results[ node.id ] ), True, WHITE )
+                    continue
+
+            # --- Context Menu Handling ---
+            if context_menu:
+                if context_menu.handle_event( screen_event ):
+                    context_menu = None # Close menu after action
+                    continue # Skip other event handling
+
+            # --- Finalize Connection ---
+            if event.type == pygame.MOUSEBUTTONUP and event.button == 1 and global_connection_state[ 'is_drawing_connection' ]:
+                target_found = False
+                start_node = graph.find_node( global_connection_state[ 'connection_start_node' ] )
+                for node in nodes:
+                    if start_node is None: break # Deleted while the connection was being drawn
+                    for sock in node.input_sockets:
+                        if sock[ 'rect' ].collidepoint( event.pos ) and sock[ 'connection' ] is None:
+                            # Create connection, unless the types do not fit
+                            start_socket = start_node.output_sockets[ global_connection_state[ 'connection_start_socket' ] ]
+                            type_error = graph.type_check( start_node, start_socket, node, sock )
+                            if type_error:
+                                print( "Cannot connect: %s" % type_error )
+                            else:
+                                graph.connect( start_node, start_socket, node, sock )
+                            target_found = True
+                            break
+                    if target_found: break
+                
                 # Reset connection drawing state
                 global_connection_state[ 'is_drawing_connection' ] = False
                 global_connection_state[ 'connection_start_node' ] = None
                 global_connection_state[ 'connection_start_socket' ] = None
                 continue
 
+            # --- Dragging the selection moves it as one batch per frame ---
+            if selection_drag:
+                if event.type == pygame.MOUSEMOTION:
+                    selection_drag[ 'pos' ] = event.pos
+                    continue
+                if event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+                    dx = event.pos[ 0 ] - selection_drag[ 'last' ][ 0 ]
+                    dy = event.pos[ 1 ] - selection_drag[ 'last' ][ 1 ]
+                    moved = selection_drag[ 'nodes' ]
+                    graph.move_nodes( moved, [ ( node.rect.x + dx, node.rect.y + dy ) for node in moved ], previous=selection_drag[ 'start' ] )
+                    selection_drag = None
+                    continue
+
+            # --- Rubber band selection ---
+            if rubber_band:
+                if event.type == pygame.MOUSEMOTION:
+                    continue
+                if event.type == pygame.MOUSEBUTTONUP and event.button == 1:
+                    band = pygame.Rect( rubber_band[ 'start' ], ( 0, 0 ) ).union( pygame.Rect( event.pos, ( 1, 1 ) ) )
+                    hits = [ node for node in nodes if band.colliderect( node.rect ) ]
+                    if rubber_band[ 'additive' ]:
+                        for node in hits:
+                            selection.add( node )
+                    else:
+                        selection.replace( hits )
+                    rubber_band = None
+                    continue
+
+            # --- Clicking the minimap jumps the view there ---
+            offset = minimap.handle_event( screen_event )
+            if offset is not None:
+                view_offset = offset
+                continue
+
             # --- Open Context Menu ---
             if event.type == pygame.MOUSEBUTTONDOWN and event.button == 3:
                 # Prevent menu if clicking on a node's socket
@@ -1018,7 +3925,7 @@ def main():
                     if on_socket: break
                 
                 if not on_socket:
-                    context_menu = ContextMenu(event.pos, { # --- Add context menu items here ---
+                    menu_options = { # --- Add context menu items here ---
                         "Integer": lambda pos: IntegerNode( pos[ 0 ], pos[ 1 ], value=0 ),
                         "Random Integer": lambda pos: RndIntegerNode( pos[ 0 ], pos[ 1 ], value=0 ),
                         "Float": lambda pos: FloatNode( pos[ 0 ], pos[ 1 ], value=0.0 ),
@@ -1039,39 +3946,79 @@ def main():
                         "Not": lambda pos: NotNode( pos[ 0 ], pos[ 1 ] ),
                         "Concatenate": lambda pos: ConcatNode( pos[ 0 ], pos[ 1 ] ),
                         "Display": lambda pos: DisplayNode( pos[ 0 ], pos[ 1 ] ),
-                        "Preview": lambda pos: PreviewNode( pos[ 0 ], pos[ 1 ] )
-                    }, nodes )
+                        "Preview": lambda pos: PreviewNode( pos[ 0 ], pos[ 1 ] ),
+                        "Read File": lambda pos: ReadFileNode( pos[ 0 ], pos[ 1 ] ),
+                        "Write File": lambda pos: WriteFileNode( pos[ 0 ], pos[ 1 ] ),
+                        "Command": lambda pos: CommandNode( pos[ 0 ], pos[ 1 ] ),
+                        "Socket": lambda pos: SocketNode( pos[ 0 ], pos[ 1 ] )
+                    }
+                    # Every collapsed group can be placed again as another instance
+                    for definition in graph.definitions:
+                        menu_options[ definition.name ] = lambda pos, definition=definition: GroupNode( pos[ 0 ], pos[ 1 ], definition )
+                    context_menu = ContextMenu( screen_event.pos, menu_options, graph, event.pos )
                     continue
 
-            # --- Pass events to nodes ---
+            # --- Shift-click toggles node selection; shift-drag on the canvas adds a band to it ---
+            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and _input.mods & pygame.KMOD_SHIFT:
+                for node in reversed( nodes ):
+                    if node.rect.collidepoint( event.pos ):
+                        selection.toggle( node )
+                        break
+                else:
+                    rubber_band = { 'start': event.pos, 'additive': True }
+                continue
+
+            # --- Grabbing the body of a selected node drags the whole selection ---
+            if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1 and len( selection ) > 1:
+                grabbed = None
+                for node in reversed( nodes ):
+                    if node.rect.collidepoint( event.pos ):
+                        grabbed = node
+                        break
+                if grabbed in selection and not grabbed.resize_handle_rect.collidepoint( event.pos ) \
+                   and not any( sock[ 'rect' ].collidepoint( event.pos ) for sock in grabbed.output_sockets ):
+                    moved = list( selection )
+                    selection_drag = { 'nodes': moved, 'start': [ ( node.rect.x, node.rect.y ) for node in moved ], 'last': event.pos, 'pos': event.pos }
+                    continue
+
+            # --- Pass events to nodes; a left click on empty canvas starts a rubber band ---
             for node in reversed( nodes ):
-                if node.handle_event( event, global_connection_state, connections ):
+                if node.handle_event( event, global_connection_state, graph ):
                     break
+            else:
+                if event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                    rubber_band = { 'start': event.pos, 'additive': False }
+
+        if selection_drag and selection_drag[ 'pos' ] != selection_drag[ 'last' ]:
+            graph.drag_nodes( selection_drag[ 'nodes' ], selection_drag[ 'pos' ][ 0 ] - selection_drag[ 'last' ][ 0 ], selection_drag[ 'pos' ][ 1 ] - selection_drag[ 'last' ][ 1 ] )
+            selection_drag[ 'last' ] = selection_drag[ 'pos' ]
 
         # --- Update & Compute ---
-        # A simple, iterative computation model. For complex graphs, a topological sort would be needed.
-        for _ in range( len( nodes ) ): # Iterate a few times to propagate changes
-            for node in nodes:
-                node.compute()
+        # The graph is always a DAG, so a single pass in topological order over the
+        # changed nodes and their dependents propagates every change. Finished I/O
+        # requests come in first, so their consumers recompute in the same pass.
+        if graph.async_runner:
+            graph.async_runner.deliver( graph )
+        graph.evaluate()
 
         # --- Drawing ---
-        screen.fill( GREY )
-
-        # Draw established connections
-        for conn in connections:
-            start_pos = conn[ 'source_socket' ][ 'pos' ]
-            end_pos = conn[ 'target_socket' ][ 'pos' ]
-            pygame.draw.line( screen, CONNECTION_COLOR, start_pos, end_pos, 2 )
-            pygame.draw.aaline( screen, WHITE, start_pos, end_pos )
+        # Background and established connections (static ones come from a cached layer)
+        connection_renderer.draw( screen, graph, view_offset )
 
         # Draw temporary connection line
-        if global_connection_state[ 'is_drawing_connection' ]:
-            start_pos = global_connection_state[ 'connection_start_socket' ][ 'pos' ]
-            pygame.draw.line( screen, CONNECTION_COLOR, start_pos, mouse_pos, 3 )
+        start_node = graph.find_node( global_connection_state[ 'connection_start_node' ] )
+        if global_connection_state[ 'is_drawing_connection' ] and start_node is not None:
+            start_pos = start_node.output_sockets[ global_connection_state[ 'connection_start_socket' ] ][ 'pos' ]
+            pygame.draw.line( screen, CONNECTION_COLOR, ( start_pos[ 0 ] + view_offset[ 0 ], start_pos[ 1 ] + view_offset[ 1 ] ), _input.mouse_pos, 3 )
 
         # Draw all nodes
         for node in nodes:
-            node.draw( screen, font )
+            node.draw( screen, font, view_offset )
+        for node, stats_surf in monte_carlo_overlay.items():
+            screen.blit( stats_surf, ( node.rect.left + view_offset[ 0 ], node.rect.bottom + 4 + view_offset[ 1 ] ) )
+        if rubber_band:
+            pygame.draw.rect( screen, SELECTION_COLOR, pygame.Rect( rubber_band[ 'start' ], ( 0, 0 ) ).union( pygame.Rect( mouse_pos, ( 1, 1 ) ) ).move( view_offset ), 1 )
+        minimap.draw( screen, view_offset )
         
         # Draw context menu if active
         if context_menu:
@@ -1079,12 +4026,77 @@ def main():
 
         # --- Update Display ---
         pygame.display.flip()
-        clock.tick( 60 )
+
+        # --- Report startup time once the first frame is on screen ---
+        if startup:
+            startup.append( ( "first frame", time.perf_counter() - phase_start ) )
+            print( "ViPr started in %.1f ms (%s)" % ( ( time.perf_counter() - _process_start ) * 1000,
+                   ", ".join( "%s %.1f ms" % ( phase, seconds * 1000 ) for phase, seconds in startup ) ) )
+            startup = None
+
+        _input.end_frame()
 
     # --- Cleanup ---
+    _input.close()
+    if graph.async_runner:
+        graph.async_runner.close()
+    if journal:
+        journal.close()
     pygame.font.quit()
     pygame.quit()
     sys.exit()
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    import argparse
+
+    parser = argparse.ArgumentParser( description="ViPr - Visual Programmer" )
+    parser.add_argument( "--serve", action="store_true", help="run the headless evaluation server instead of the editor" )
+    parser.add_argument( "--host", default="127.0.0.1" )
+    parser.add_argument( "--port", type=int, default=8765 )
+    parser.add_argument( "--workers", type=int, default=None, help="evaluation worker processes (default: CPU count)" )
+    parser.add_argument( "--monte-carlo", type=int, metavar="SAMPLES", help="print output statistics over SAMPLES random draws and exit" )
+    parser.add_argument( "--seed", type=int, default=0, help="seed for Monte Carlo runs (Ctrl+M in the editor)" )
+    parser.add_argument( "--evaluate", action="store_true", help="print the output node values of a graph and exit" )
+    parser.add_argument( "--record", metavar="FILE", help="record the editor session (starting graph and input) to FILE" )
+    parser.add_argument( "--replay", metavar="FILE", help="replay a recorded session with a fixed timestep and report frame times" )
+    parser.add_argument( "--timings", metavar="FILE", help="write the per-frame times of --replay to FILE as JSON" )
+    parser.add_argument( "--graph", help="graph JSON for --evaluate and --monte-carlo (default: the autosaved session)" )
+    parser.add_argument( "--allow-io", action="store_true", help="let --serve, --evaluate and --monte-carlo graphs use the file, command and socket nodes" )
+    args = parser.parse_args()
+
+    if args.serve:
+        serve( args.host, args.port, args.workers, args.allow_io )
+    elif args.evaluate or args.monte_carlo:
+        if args.graph:
+            with open( args.graph ) as f:
+                graph_data = json.load( f )
+        else:
+            graph_data = load_autosave()
+        if not graph_data:
+            parser.error( "no graph to run; pass --graph or open the editor first" )
+        started = time.perf_counter()
+        try:
+            graph = graph_from_dict( graph_data, headless_node_types( args.allow_io ) )
+        except ValueError as error:
+            parser.error( "%s; the file, command and socket nodes need --allow-io" % error )
+        if args.monte_carlo:
+            if any( isinstance( node, AsyncNode ) for node in graph.nodes ):
+                graph.evaluate() # Runs the I/O once; the samples reuse its results
+            results = monte_carlo( graph, args.monte_carlo, args.seed )
+            print( json.dumps( { 'samples': args.monte_carlo, 'seed': args.seed, 'elapsed_s': round( time.perf_counter() - started, 3 ),
+                                 'outputs': { str( node_id ): stats for node_id, stats in results.items() } }, indent=2 ) )
+        else:
+            cache = graph.result_cache = ResultCache() if CACHE_MAX_BYTES else None
+            graph.evaluate()
+            report = { 'elapsed_s': round( time.perf_counter() - started, 3 ),
+                       'outputs': { str( node.id ): _json_result( node.display_value ) for node in graph.nodes if type( node ).__name__ in OUTPUT_NODE_TYPES } }
+            if cache:
+                report[ 'cache' ] = { 'hits': cache.hits, 'stores': cache.stores }
+            print( json.dumps( report, indent=2 ) )
+    elif args.replay:
+        os.environ.setdefault( "SDL_VIDEODRIVER", "dummy" ) # No window needed to measure frames
+        main( args.seed, ReplayInput( args.replay, args.timings ) )
+    elif args.record:
+        main( args.seed, RecordingInput( args.record, args.seed ) )
+    else:
+        main( args.seed )
\ No newline at end of file